@@ -1,36 +1,103 @@
-from sqlalchemy import select, delete
-from app.database.models import async_session, Admin
+import os
+import time
+from sqlalchemy import select, delete, update
+from app.database.models import Admin
+from app.database.unit_of_work import session_scope, after_commit
 
 
-async def is_admin(username):
-    async with async_session() as session:
-        username = username.strip('@')
-        admin = await session.scalar(select(Admin).where(Admin.username == username))
-        if admin:
-            us = admin.username
-            cre = admin.permission
-            await session.commit()
-            return True, us, cre
-        else:
-            await session.commit()
-            return False, None, 0
+class AdminRegistry:
+    """Список администраторов в памяти: проверка прав — поиск в словаре, а не запрос к БД.
+
+    Загружается при старте, сбрасывается в set_admin/delete_admin.
+    ttl > 0 — дополнительно перечитывать таблицу не реже раза в ttl секунд.
+    """
+
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self._by_username: dict[str, tuple[str, int]] = {}
+        self._by_user_id: dict[int, tuple[str, int]] = {}
+        self._bound: set[str] = set()  # username (lower), у которых в БД уже записан user_id
+        self._loaded_at: float | None = None
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    async def load(self):
+        async with session_scope() as session:
+            admins = (await session.scalars(select(Admin))).all()
+        by_username, by_user_id, bound = {}, {}, set()
+        for a in admins:
+            entry = (a.username, a.permission)
+            by_username[a.username.lower()] = entry
+            if a.user_id:
+                by_user_id[a.user_id] = entry
+                bound.add(a.username.lower())
+        self._by_username, self._by_user_id, self._bound = by_username, by_user_id, bound
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    async def get(self, username: str | None, user_id: int | None = None) -> tuple[str, int] | None:
+        if not self._is_fresh():
+            await self.load()
+        if user_id and user_id in self._by_user_id:
+            return self._by_user_id[user_id]
+        if not username:
+            return None
+        key = username.strip('@').lower()
+        entry = self._by_username.get(key)
+        if entry and user_id:
+            if key in self._bound:
+                # Админ с этим username уже узнан по другому id — username занял кто-то другой
+                return None
+            # Первый вход админа — запоминаем его id, дальше узнаём даже после смены username.
+            # Только если id ещё не записан: из двух одновременных входов привяжется один
+            async with session_scope() as session:
+                result = await session.execute(
+                    update(Admin).where(Admin.username == entry[0], Admin.user_id.is_(None)).values(user_id=user_id)
+                )
+            if not result.rowcount:
+                self.invalidate()
+                return None
+            self._by_user_id[user_id] = entry
+            self._bound.add(key)
+        return entry
+
+
+admin_registry = AdminRegistry(ttl=float(os.getenv('ADMIN_CACHE_TTL', '0')))
+
+
+async def load_admins():
+    await admin_registry.load()
+
+
+async def is_admin(username, user_id=None):
+    entry = await admin_registry.get(username, user_id)
+    if entry:
+        us, cre = entry
+        return True, us, cre
+    return False, None, 0
 
 
 async def delete_admin(from_user, username):
-    async with async_session() as session:
-        username = username.strip('@')
-        admin1 = await session.scalar(select(Admin).where(Admin.username == from_user.username))
-        admin2 = await session.scalar(select(Admin).where(Admin.username == username))
-        if admin1.permission > admin2.permission:
-            await session.execute(delete(Admin).where(Admin.username == username))
-            await session.commit()
-            return True
-        await session.commit()
+    # Оба админа — через реестр, как в is_admin: по user_id и username без учёта регистра
+    admin1 = await admin_registry.get(from_user.username, from_user.id)
+    admin2 = await admin_registry.get(username)
+    if admin1 is None or admin2 is None:
         return False
+    if admin1[1] > admin2[1]:
+        async with session_scope() as session:
+            await session.execute(delete(Admin).where(Admin.username == admin2[0]))
+        after_commit(admin_registry.invalidate)
+        return True
+    return False
 
 
 async def all_admins():
-    async with async_session() as session:
+    async with session_scope() as session:
         res = []
         nicknames = []
         admin = await session.scalars(select(Admin))
@@ -41,8 +108,8 @@ async def all_admins():
 
 
 async def set_admin(username1, permission=0):
-    async with async_session() as session:
+    async with session_scope() as session:
         admin = await session.scalar(select(Admin).where(Admin.username == username1))
         if not admin:
             session.add(Admin(username=username1, permission=permission))
-            await session.commit()
\ No newline at end of file
+            after_commit(admin_registry.invalidate)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.types import Message
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.models import async_session, AlbumGroup, AlbumPart
+
+logger = logging.getLogger(__name__)
+
+
+class DBAlbumBuffer:
+    """Сборка альбомов через БД — для нескольких воркеров бота (ALBUM_BACKEND=db).
+
+    Части одного альбома могут прийти в разные процессы. Каждый воркер пишет свою часть
+    в album_parts; тот, чья вставка в album_groups прошла первой, становится лидером:
+    ждёт остальные части (те же quiet / max_wait / max_parts, что и в памяти), забирает
+    их и удаляет строки. Остальные воркеры просто возвращают None.
+    """
+
+    def __init__(self, quiet: float, max_wait: float, max_parts: int, poll: float = 0.1):
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.max_parts = max_parts
+        self.poll = poll
+
+    async def add(self, key: tuple[int, str], message: Message, bot: Bot) -> list[Message] | None:
+        chat_id, media_group_id = key
+        now = datetime.now()
+        async with async_session() as session:
+            await session.execute(sqlite_insert(AlbumPart).values(
+                chat_id=chat_id, media_group_id=media_group_id, message_id=message.message_id,
+                payload=message.model_dump(mode='json', by_alias=True, exclude_none=True), received_at=now,
+            ).on_conflict_do_nothing())
+            res = await session.execute(sqlite_insert(AlbumGroup).values(
+                chat_id=chat_id, media_group_id=media_group_id, created_at=now,
+            ).on_conflict_do_nothing())
+            await session.commit()
+        if res.rowcount != 1:
+            return None  # альбом собирает другой воркер (или этот же, но с первой части)
+
+        try:
+            await self._wait_parts(chat_id, media_group_id)
+        finally:
+            payloads = await self._take(chat_id, media_group_id)
+        return [Message.model_validate(p, context={'bot': bot}) for p in payloads]
+
+    async def _wait_parts(self, chat_id: int, media_group_id: str):
+        started = time.monotonic()
+        seen, last_change = 0, started
+        while time.monotonic() - started < self.max_wait:
+            await asyncio.sleep(self.poll)
+            async with async_session() as session:
+                count = await session.scalar(
+                    select(func.count()).select_from(AlbumPart)
+                    .where(AlbumPart.chat_id == chat_id, AlbumPart.media_group_id == media_group_id)
+                )
+            if count >= self.max_parts:
+                return
+            if count != seen:
+                seen, last_change = count, time.monotonic()
+            elif time.monotonic() - last_change >= self.quiet:
+                return
+
+    async def _take(self, chat_id: int, media_group_id: str) -> list[dict]:
+        where = (AlbumPart.chat_id == chat_id, AlbumPart.media_group_id == media_group_id)
+        async with async_session() as session:
+            rows = await session.scalars(select(AlbumPart.payload).where(*where).order_by(AlbumPart.message_id))
+            payloads = rows.all()
+            await session.execute(delete(AlbumPart).where(*where))
+            await session.execute(delete(AlbumGroup).where(AlbumGroup.chat_id == chat_id,
+                                                           AlbumGroup.media_group_id == media_group_id))
+            # Альбомы, лидер которых умер, не дособрав их
+            stale = datetime.now() - timedelta(seconds=10 * self.max_wait)
+            await session.execute(delete(AlbumGroup).where(AlbumGroup.created_at < stale))
+            await session.execute(delete(AlbumPart).where(AlbumPart.received_at < stale))
+            await session.commit()
+        return payloads
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.models import BroadcastDelivery, BroadcastStats, BroadcastPost
+from app.database.unit_of_work import session_scope
+
+
+def _totals(rows: list[dict]) -> list[dict]:
+    totals: dict[int, dict] = {}
+    for row in rows:
+        t = totals.setdefault(row['broadcast_id'], {
+            'broadcast_id': row['broadcast_id'], 'delivered': 0, 'failed': 0,
+            'latency_ms_total': 0, 'latency_ms_max': 0, 'last_actual_at': None,
+        })
+        if row['delivered']:
+            t['delivered'] += 1
+            t['latency_ms_total'] += row['latency_ms']
+            t['latency_ms_max'] = max(t['latency_ms_max'], row['latency_ms'])
+            t['last_actual_at'] = max(filter(None, (t['last_actual_at'], row['actual_at'])))
+        else:
+            t['failed'] += 1
+    return list(totals.values())
+
+
+async def record_deliveries(rows: list[dict]):
+    """Пачка строк журнала и приращение итогов broadcast_stats — одной транзакцией.
+
+    rows — словари с ключами broadcast_id, chat_id, message_ids, planned_at, actual_at, latency_ms, delivered.
+    Задержка в итогах считается только по доставленным сообщениям.
+    """
+    if not rows:
+        return
+    async with session_scope() as session:
+        await session.execute(insert(BroadcastDelivery), rows)
+        stmt = sqlite_insert(BroadcastStats)
+        stmt = stmt.on_conflict_do_update(index_elements=[BroadcastStats.broadcast_id], set_={
+            'delivered': BroadcastStats.delivered + stmt.excluded.delivered,
+            'failed': BroadcastStats.failed + stmt.excluded.failed,
+            'latency_ms_total': BroadcastStats.latency_ms_total + stmt.excluded.latency_ms_total,
+            'latency_ms_max': func.max(BroadcastStats.latency_ms_max, stmt.excluded.latency_ms_max),
+            # max() с NULL в SQLite даёт NULL — берём непустое значение
+            'last_actual_at': func.coalesce(func.max(BroadcastStats.last_actual_at, stmt.excluded.last_actual_at),
+                                            stmt.excluded.last_actual_at, BroadcastStats.last_actual_at),
+        })
+        await session.execute(stmt, _totals(rows))
+
+
+async def delivery_summary(broadcast_ids: list[int] | None = None, active_only: bool = False) -> list[dict]:
+    """Доставлено против оплаченного по кампаниям — из broadcast_stats, без прохода по журналу."""
+    stmt = (
+        select(BroadcastPost.id, BroadcastPost.is_active, BroadcastPost.messages_promised,
+               BroadcastStats.delivered, BroadcastStats.failed, BroadcastStats.latency_ms_total,
+               BroadcastStats.latency_ms_max, BroadcastStats.last_actual_at)
+        .outerjoin(BroadcastStats, BroadcastStats.broadcast_id == BroadcastPost.id)
+        .order_by(BroadcastPost.id)
+    )
+    if broadcast_ids is not None:
+        stmt = stmt.where(BroadcastPost.id.in_(broadcast_ids))
+    if active_only:
+        stmt = stmt.where(BroadcastPost.is_active == True)
+    async with session_scope() as session:
+        rows = (await session.execute(stmt)).all()
+    summary = []
+    for bid, is_active, promised, delivered, failed, latency_total, latency_max, last_actual in rows:
+        delivered, failed = delivered or 0, failed or 0
+        summary.append({
+            'broadcast_id': bid,
+            'is_active': is_active,
+            'promised': promised,
+            'delivered': delivered,
+            'failed': failed,
+            'remaining': max(promised - delivered, 0) if promised is not None else None,
+            'latency_ms_avg': (latency_total or 0) // delivered if delivered else None,
+            'latency_ms_max': latency_max or 0,
+            'last_actual_at': last_actual,
+        })
+    return summary
+
+
+async def list_deliveries(broadcast_id: int, since: datetime | None = None, until: datetime | None = None,
+                          limit: int = 50):
+    """Последние записи журнала кампании (по индексу broadcast_id, planned_at)."""
+    stmt = select(BroadcastDelivery).where(BroadcastDelivery.broadcast_id == broadcast_id)
+    if since is not None:
+        stmt = stmt.where(BroadcastDelivery.planned_at >= since)
+    if until is not None:
+        stmt = stmt.where(BroadcastDelivery.planned_at < until)
+    async with session_scope() as session:
+        deliveries = await session.scalars(stmt.order_by(BroadcastDelivery.planned_at.desc()).limit(limit))
+        return deliveries.all()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.models import async_session, FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class _Entry:
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None, updated_at: Optional[datetime] = None):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at or _utcnow()
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в нашей БД (таблица fsm_states) с LRU-кэшем в памяти.
+
+    Чтения обслуживаются из кэша; промахи, пришедшие в одном тике цикла, грузятся одним SELECT.
+    Изменения сразу видны в кэше, а в БД уходят пачкой раз в flush_interval секунд
+    (и при close()). Состояния, не менявшиеся дольше ttl, считаются брошенными и удаляются.
+    """
+
+    def __init__(self, cache_size: int = 10_000, ttl: timedelta = timedelta(days=2),
+                 flush_interval: float = 0.5, purge_interval: float = 3600):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._pending_loads: dict[str, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._loader: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id or '',
+            getattr(key, 'business_connection_id', None) or '', key.destiny,
+        ))
+
+    def _expired(self, entry: _Entry) -> bool:
+        return _utcnow() - entry.updated_at > self.ttl
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name='fsm_storage_flush')
+
+    # --- чтение ---
+
+    async def _get_entry(self, key: StorageKey) -> _Entry:
+        k = self._key(key)
+        entry = self._cache.get(k)
+        if entry is None:
+            fut = self._pending_loads.get(k)
+            if fut is None:
+                fut = self._pending_loads[k] = asyncio.get_running_loop().create_future()
+                if len(self._pending_loads) == 1:
+                    # Задача стартует после уже готовых к запуску хендлеров — их промахи попадут в тот же SELECT
+                    self._loader = asyncio.create_task(self._load_batch())
+            entry = await fut
+        if self._expired(entry) and not entry.empty:
+            entry = _Entry()
+            self._cache[k] = entry
+            self._dirty.add(k)
+            self._ensure_flusher()
+        self._cache.move_to_end(k)
+        return entry
+
+    async def _load_batch(self):
+        batch, self._pending_loads = self._pending_loads, {}
+        try:
+            async with async_session() as session:
+                rows = await session.scalars(select(FSMRecord).where(FSMRecord.key.in_(list(batch))))
+                found = {r.key: _Entry(r.state, r.data, r.updated_at) for r in rows}
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for k, fut in batch.items():
+            # Пока шёл SELECT, ключ мог быть записан — запись в кэше свежее
+            entry = self._cache.get(k) or found.get(k) or _Entry()
+            self._cache[k] = entry
+            if not fut.done():
+                fut.set_result(entry)
+        self._evict()
+
+    def _evict(self):
+        if len(self._cache) <= self.cache_size:
+            return
+        for k in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if k not in self._dirty:
+                del self._cache[k]
+
+    # --- интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._get_entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.updated_at = _utcnow()
+        self._dirty.add(self._key(key))
+        self._ensure_flusher()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._get_entry(key)
+        entry.data = dict(data)
+        entry.updated_at = _utcnow()
+        self._dirty.add(self._key(key))
+        self._ensure_flusher()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_entry(key)).data.copy()
+
+    async def close(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    # --- запись в БД ---
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+            for k in keys:
+                entry = self._cache.get(k)
+                if entry is None or entry.empty:
+                    deletes.append(k)
+                else:
+                    upserts.append({'key': k, 'state': entry.state, 'data': entry.data, 'updated_at': entry.updated_at})
+            try:
+                async with async_session() as session:
+                    if upserts:
+                        stmt = sqlite_insert(FSMRecord)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[FSMRecord.key],
+                            set_={'state': stmt.excluded.state, 'data': stmt.excluded.data,
+                                  'updated_at': stmt.excluded.updated_at},
+                        )
+                        await session.execute(stmt, upserts)
+                    if deletes:
+                        await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+                    await session.commit()
+            except Exception as e:
+                # Вернём ключи в очередь, чтобы не потерять изменения
+                self._dirty |= keys
+                logger.error(f"FSM storage flush failed ({len(keys)} keys): {e}")
+            self._evict()
+
+    async def purge_expired(self):
+        cutoff = _utcnow() - self.ttl
+        async with async_session() as session:
+            res = await session.execute(delete(FSMRecord).where(FSMRecord.updated_at < cutoff))
+            await session.commit()
+        for k in [k for k, e in self._cache.items() if self._expired(e) and k not in self._dirty]:
+            del self._cache[k]
+        if res.rowcount:
+            logger.info(f"FSM storage: purged {res.rowcount} abandoned states")
+
+    async def _flush_loop(self):
+        last_purge = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if loop.time() - last_purge >= self.purge_interval:
+                last_purge = loop.time()
+                try:
+                    await self.purge_expired()
+                except Exception as e:
+                    logger.error(f"FSM storage purge failed: {e}")
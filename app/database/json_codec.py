@@ -0,0 +1,29 @@
+import json
+from datetime import date, datetime
+
+# JSON-колонки хранят и datetime (данные FSM, заказы), поэтому сериализуем их с маркером типа
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, date):
+        return {'__date__': obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _object_hook(obj: dict):
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def dumps(value) -> str:
+    return json.dumps(value, default=_default, ensure_ascii=False)
+
+
+def loads(value: str):
+    return json.loads(value, object_hook=_object_hook)
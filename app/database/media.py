@@ -0,0 +1,114 @@
+from sqlalchemy import select, insert, delete, func, literal, bindparam, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.database.models import Media, PostMedia
+
+# Владельцы фото в post_media
+PENDING = 'pending'
+SCHEDULED = 'scheduled'
+BROADCAST = 'broadcast'
+
+
+def media_items(file_ids: list[str] | None, unique_ids: list[str] | None = None) -> list[tuple[str, str]]:
+    """Пары (file_unique_id, file_id) в исходном порядке, без повторов одного файла.
+
+    unique_ids — параллельный file_ids список file_unique_id; где его нет, ключом служит file_id.
+    """
+    unique_ids = unique_ids or []
+    items: dict[str, str] = {}
+    for i, file_id in enumerate(file_ids or []):
+        unique_id = unique_ids[i] if i < len(unique_ids) and unique_ids[i] else file_id
+        items.setdefault(unique_id, file_id)
+    return list(items.items())
+
+
+# Диалектный sqlite insert с ON CONFLICT не кэшируется SQLAlchemy и компилируется на каждый вызов —
+# на горячем пути приёма альбомов используем кэшируемые text() и insert().prefix_with('OR IGNORE')
+_UPSERT_MEDIA = text(
+    "INSERT INTO media (file_unique_id, file_id) VALUES (:file_unique_id, :file_id) "
+    "ON CONFLICT (file_unique_id) DO UPDATE SET file_id = excluded.file_id RETURNING id"
+)
+
+
+async def upsert_media(session: AsyncSession, items: list[tuple[str, str]]) -> dict[str, int]:
+    """Вставка файлов; уже известные обновляют file_id. Возвращает file_unique_id -> media.id.
+
+    По выражению на файл: RETURNING не работает с executemany, а отдельный SELECT id
+    удлинял бы транзакцию записи — в части альбома обычно одно фото.
+    """
+    conn = await session.connection()
+    ids = {}
+    for unique_id, file_id in items:
+        result = await conn.execute(_UPSERT_MEDIA, {'file_unique_id': unique_id, 'file_id': file_id})
+        ids[unique_id] = result.scalar_one()
+    return ids
+
+
+async def link_media(session: AsyncSession, kind: str, owner_id: int, items: list[tuple[str, str]],
+                     append: bool = False):
+    """Привязывает фото к посту: append=False — заменяет список, True — дописывает в конец.
+
+    Позиция при дописывании считается внутри самого INSERT, а повтор файла отсекается
+    уникальным индексом — параллельные части одного альбома не теряются и не дублируются.
+    """
+    if not append:
+        await session.execute(delete(PostMedia).where(PostMedia.owner_kind == kind, PostMedia.owner_id == owner_id))
+    ids = await upsert_media(session, items)
+    if not ids:
+        return
+    next_position = (
+        select(func.coalesce(func.max(PostMedia.position) + 1, 0))
+        .where(PostMedia.owner_kind == kind, PostMedia.owner_id == owner_id)
+        .scalar_subquery()
+    )
+    stmt = insert(PostMedia).prefix_with('OR IGNORE').from_select(
+        ['owner_kind', 'owner_id', 'position', 'media_id'],
+        select(literal(kind), literal(owner_id), next_position, bindparam('media_id')),
+    )
+    # Через Core: session.execute со списком параметров увёл бы INSERT ... SELECT в ORM bulk insert,
+    # который такие выражения не поддерживает
+    conn = await session.connection()
+    await conn.execute(stmt, [{'media_id': ids[unique_id]} for unique_id, _ in items])
+
+
+async def link_media_many(session: AsyncSession, kind: str, owners: dict[int, list[tuple[str, str]]]):
+    """Фото для пачки новых постов: одна вставка в media и одна в post_media."""
+    ids = await upsert_media(session, list(dict.fromkeys(item for items in owners.values() for item in items)))
+    rows = [
+        {'owner_kind': kind, 'owner_id': owner_id, 'position': position, 'media_id': ids[unique_id]}
+        for owner_id, items in owners.items()
+        for position, (unique_id, _) in enumerate(items)
+    ]
+    if rows:
+        await session.execute(sqlite_insert(PostMedia).on_conflict_do_nothing(), rows)
+
+
+async def unlink_media(session: AsyncSession, kind: str, owner_ids: list[int]):
+    await session.execute(delete(PostMedia).where(PostMedia.owner_kind == kind, PostMedia.owner_id.in_(owner_ids)))
+
+
+async def attach_media(session: AsyncSession, kind: str, posts):
+    """Заполняет photo_file_ids загруженных постов из post_media одним запросом.
+
+    Значение ставится как уже сохранённое — объект не становится «грязным».
+    Посты без строк в post_media (не перенесённые старые данные) остаются как есть.
+    """
+    posts = [p for p in posts if p is not None]
+    if not posts:
+        return posts
+    rows = await session.execute(
+        select(PostMedia.owner_id, Media.file_id)
+        .join(Media, Media.id == PostMedia.media_id)
+        .where(PostMedia.owner_kind == kind, PostMedia.owner_id.in_([p.id for p in posts]))
+        .order_by(PostMedia.owner_id, PostMedia.position)
+    )
+    found: dict[int, list[str]] = {}
+    for owner_id, file_id in rows:
+        found.setdefault(owner_id, []).append(file_id)
+    for post in posts:
+        if post.id in found:
+            set_committed_value(post, 'photo_file_ids', found[post.id])
+    return posts
+
@@ -1,9 +1,60 @@
-from sqlalchemy import BigInteger, String, DateTime, JSON, Integer, Boolean
+import os
+import dotenv
+from sqlalchemy import BigInteger, String, DateTime, JSON, Integer, Boolean, Index, ForeignKey, text, event
+from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, async_sessionmaker, create_async_engine
+from app.database import json_codec
 
-engine = create_async_engine(url='sqlite+aiosqlite:///db.sqlite3', echo=False)
-async_session = async_sessionmaker(engine)
+dotenv.load_dotenv()
+
+# Профили движка: PRAGMA применяются на каждом новом соединении.
+# default — настройки SQLite по умолчанию (rollback journal, synchronous=FULL),
+# tuned — WAL + synchronous=NORMAL: читатели не блокируют писателя, коммит без fsync журнала.
+ENGINE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'engine': {},
+    },
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,  # в КиБ (отрицательное значение), т.е. 64 МиБ
+            'busy_timeout': 5000,      # мс ожидания вместо мгновенного "database is locked"
+            'temp_store': 'MEMORY',
+        },
+        'engine': {
+            'pool_size': 5,
+            'max_overflow': 10,
+            'pool_pre_ping': False,
+        },
+    },
+}
+
+
+def make_engine(url: str, profile: str = 'tuned') -> AsyncEngine:
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {', '.join(ENGINE_PROFILES)}")
+    cfg = ENGINE_PROFILES[profile]
+    new_engine = create_async_engine(url=url, echo=False, json_serializer=json_codec.dumps,
+                                     json_deserializer=json_codec.loads, **cfg['engine'])
+    pragmas = cfg['pragmas']
+    if pragmas and new_engine.dialect.name == 'sqlite':
+        @event.listens_for(new_engine.sync_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return new_engine
+
+
+engine = make_engine(os.getenv('DB_URL', 'sqlite+aiosqlite:///db.sqlite3'), os.getenv('DB_PROFILE', 'tuned'))
+# Объекты остаются читаемыми после commit: их отдают наружу из session_scope/unit_of_work,
+# а повторная подгрузка атрибутов в async-коде невозможна
+async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -18,10 +69,14 @@ class LastMessage(Base):
 
 class PendingPost(Base):
     __tablename__ = 'pending_posts'
+    __table_args__ = (
+        # Один альбом — одна строка: части альбома дописываются в неё через INSERT ... ON CONFLICT
+        Index('uq_pending_posts_media_group', 'media_group_id', unique=True, sqlite_where=text('media_group_id != 0')),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     content_type: Mapped[str] = mapped_column()
     text: Mapped[str] = mapped_column()
-    photo_file_ids = mapped_column(JSON, default=list)
+    photo_file_ids = mapped_column(MutableList.as_mutable(JSON), default=list)
     media_group_id: Mapped[int] = mapped_column()
     # Новое: целевой чат для публикации
     chat_id: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -31,14 +86,18 @@ class PendingPost(Base):
 
 class ScheduledPost(Base):
     __tablename__ = 'scheduled_posts'
+    __table_args__ = (
+        # Частичный индекс только по неопубликованным — «навсегда»-посты его не раздувают
+        Index('ix_scheduled_posts_due', 'scheduled_time', sqlite_where=text('is_published = 0')),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     content_type: Mapped[str] = mapped_column()
     text: Mapped[str | None] = mapped_column()
-    photo_file_ids = mapped_column(JSON, default=list)
+    photo_file_ids = mapped_column(MutableList.as_mutable(JSON), default=list)
     scheduled_time = mapped_column(DateTime)
     media_group_id: Mapped[int] = mapped_column()
     is_published: Mapped[bool] = mapped_column(default=False)
-    message_ids: Mapped[list] = mapped_column(JSON, default=list)
+    message_ids: Mapped[list] = mapped_column(MutableList.as_mutable(JSON), default=list)
     unpin_time = mapped_column(DateTime, default=None, nullable=True)
     delete_time = mapped_column(DateTime, default=None, nullable=True)
     # Новое: целевой чат для публикации
@@ -50,7 +109,7 @@ class ScheduledPost(Base):
 class PostIsPinned(Base):
     __tablename__ = 'is_pinned'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    post_id: Mapped[int] = mapped_column()
+    post_id: Mapped[int] = mapped_column(index=True)
     pinned: Mapped[bool] = mapped_column(default=False)
 
 
@@ -59,14 +118,20 @@ class Admin(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     username: Mapped[str] = mapped_column(String(40))
     permission: Mapped[int] = mapped_column()
+    # Telegram id — запоминается при первой проверке прав, чтобы узнавать админа и после смены username
+    user_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True, default=None, index=True)
 
 
 class BroadcastPost(Base):
     __tablename__ = 'broadcast_posts'
+    __table_args__ = (
+        # Частичный индекс по активным кампаниям для выборки «пора публиковать»
+        Index('ix_broadcast_posts_active_next', 'next_run_time', sqlite_where=text('is_active = 1')),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     content_type: Mapped[str] = mapped_column()
     text: Mapped[str | None] = mapped_column()
-    photo_file_ids = mapped_column(JSON, default=list)
+    photo_file_ids = mapped_column(MutableList.as_mutable(JSON), default=list)
     media_group_id: Mapped[int] = mapped_column(default=0)
     next_run_time = mapped_column(DateTime)
     end_time = mapped_column(DateTime)
@@ -81,6 +146,8 @@ class BroadcastPost(Base):
     active_end_min: Mapped[int] = mapped_column(Integer, default=23*60)    # 23:00
     # NEW: entities для форматирования
     entities = mapped_column(JSON, default=list)
+    # Сколько сообщений оплачено по заказу (menu.total_messages); None — кампания без заказа
+    messages_promised: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
 
 class BroadcastConfig(Base):
@@ -91,6 +158,97 @@ class BroadcastConfig(Base):
     active_end_min: Mapped[int] = mapped_column(Integer, default=23*60)
 
 
+class BroadcastDelivery(Base):
+    """Журнал отправок рассылок: строка на каждое срабатывание слота, только дописывается."""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        Index('ix_broadcast_deliveries_broadcast_planned', 'broadcast_id', 'planned_at'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    broadcast_id: Mapped[int] = mapped_column(BigInteger)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_ids = mapped_column(JSON, default=list)
+    planned_at = mapped_column(DateTime)  # слот календаря
+    actual_at = mapped_column(DateTime)   # когда отправка завершилась
+    latency_ms: Mapped[int] = mapped_column(Integer)
+    delivered: Mapped[bool] = mapped_column(Boolean)
+
+
+class BroadcastStats(Base):
+    """Итоги по кампании — обновляются тем же пакетом, что и журнал, чтобы сводка не сканировала журнал."""
+    __tablename__ = 'broadcast_stats'
+    broadcast_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    delivered: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    latency_ms_total: Mapped[int] = mapped_column(BigInteger, default=0)
+    latency_ms_max: Mapped[int] = mapped_column(Integer, default=0)
+    last_actual_at = mapped_column(DateTime, nullable=True)
+
+
+class Order(Base):
+    __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_status_created', 'status', 'created_at'),
+    )
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)  # uuid4 из callback-кнопок
+    order_type: Mapped[str] = mapped_column(String(16), default='publication')
+    # awaiting | confirmed | rejected | expired
+    status: Mapped[str] = mapped_column(String(16), default='awaiting')
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    payload = mapped_column(JSON, default=dict)
+    created_at = mapped_column(DateTime)
+    updated_at = mapped_column(DateTime)
+
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_states'
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data = mapped_column(JSON, default=dict)
+    updated_at = mapped_column(DateTime, index=True)
+
+
+class Media(Base):
+    """Файл (фото) в единственном экземпляре: одинаковые фото разных постов ссылаются на одну строку."""
+    __tablename__ = 'media'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # file_unique_id одинаков для одного файла у любых ботов и во времени; если он неизвестен
+    # (старые данные), ключом служит сам file_id
+    file_unique_id: Mapped[str] = mapped_column(String(255), unique=True)
+    file_id: Mapped[str] = mapped_column(String(255))
+
+
+class PostMedia(Base):
+    """Фото поста по порядку. owner_kind: pending | scheduled | broadcast, owner_id — id в его таблице."""
+    __tablename__ = 'post_media'
+    __table_args__ = (
+        # Один файл в посте не повторяется
+        Index('uq_post_media_owner_media', 'owner_kind', 'owner_id', 'media_id', unique=True),
+    )
+    owner_kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    owner_id = mapped_column(BigInteger, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    media_id: Mapped[int] = mapped_column(ForeignKey('media.id'), index=True)
+
+
+class AlbumGroup(Base):
+    """Альбом, который сейчас собирается (ALBUM_BACKEND=db). Строку вставляет воркер-«лидер»."""
+    __tablename__ = 'album_groups'
+    chat_id = mapped_column(BigInteger, primary_key=True)
+    media_group_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    created_at = mapped_column(DateTime, index=True)
+
+
+class AlbumPart(Base):
+    """Часть альбома, принятая любым из воркеров: Message в формате Bot API."""
+    __tablename__ = 'album_parts'
+    chat_id = mapped_column(BigInteger, primary_key=True)
+    media_group_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    message_id = mapped_column(BigInteger, primary_key=True)
+    payload = mapped_column(JSON)
+    received_at = mapped_column(DateTime)
+
+
 async def async_main():
     async with engine.begin() as conn:
         # Создаём таблицы, если их нет
@@ -124,6 +282,7 @@ async def async_main():
                 'active_start_min': "ALTER TABLE broadcast_posts ADD COLUMN active_start_min INTEGER DEFAULT 540",
                 'active_end_min': "ALTER TABLE broadcast_posts ADD COLUMN active_end_min INTEGER DEFAULT 1380",
                 'entities': "ALTER TABLE broadcast_posts ADD COLUMN entities JSON DEFAULT '[]'",
+                'messages_promised': "ALTER TABLE broadcast_posts ADD COLUMN messages_promised INTEGER",
             }
             for col, sql in alter_map.items():
                 if col not in cols:
@@ -137,3 +296,79 @@ async def async_main():
                 await conn.run_sync(Base.metadata.create_all)
         except Exception:
             pass
+        try:
+            res = await conn.exec_driver_sql("PRAGMA table_info(admins)")
+            cols = [row[1] for row in res.fetchall()]
+            if 'user_id' not in cols:
+                await conn.exec_driver_sql("ALTER TABLE admins ADD COLUMN user_id BIGINT")
+        except Exception:
+            pass
+        try:
+            # Сжатие last_message до одной строки id=1: раньше на каждую публикацию добавлялась новая строка
+            res = await conn.exec_driver_sql("SELECT COUNT(*), MAX(id) FROM last_message")
+            count, max_id = res.fetchone()
+            if count and (count > 1 or max_id != 1):
+                res = await conn.exec_driver_sql("SELECT time FROM last_message WHERE id = ?", (max_id,))
+                latest = res.scalar()
+                await conn.exec_driver_sql("DELETE FROM last_message")
+                await conn.exec_driver_sql("INSERT INTO last_message (id, time) VALUES (1, ?)", (latest,))
+        except Exception:
+            pass
+        try:
+            # Склеиваем дубли альбомов в pending_posts (раньше части одного альбома могли лечь разными строками),
+            # иначе уникальный индекс uq_pending_posts_media_group не создастся
+            res = await conn.exec_driver_sql(
+                "SELECT media_group_id FROM pending_posts WHERE media_group_id != 0 "
+                "GROUP BY media_group_id HAVING COUNT(*) > 1"
+            )
+            for (media_group_id,) in res.fetchall():
+                res = await conn.exec_driver_sql(
+                    "SELECT id, text, photo_file_ids FROM pending_posts WHERE media_group_id = ? ORDER BY id",
+                    (media_group_id,)
+                )
+                rows = res.fetchall()
+                file_ids = [fid for row in rows for fid in json_codec.loads(row[2] or '[]')]
+                text_ = next((row[1] for row in reversed(rows) if row[1]), rows[0][1])
+                await conn.exec_driver_sql(
+                    "UPDATE pending_posts SET photo_file_ids = ?, text = ? WHERE id = ?",
+                    (json_codec.dumps(file_ids), text_, rows[0][0])
+                )
+                await conn.exec_driver_sql(
+                    "DELETE FROM pending_posts WHERE media_group_id = ? AND id != ?", (media_group_id, rows[0][0])
+                )
+        except Exception:
+            pass
+        try:
+            # Перенос фото из JSON-колонок photo_file_ids в media/post_media (дедупликация по файлу).
+            # file_unique_id у старых данных неизвестен — ключом служит file_id
+            for table, kind in (('pending_posts', 'pending'), ('scheduled_posts', 'scheduled'),
+                                ('broadcast_posts', 'broadcast')):
+                res = await conn.exec_driver_sql(
+                    f"SELECT id, photo_file_ids FROM {table} "
+                    f"WHERE photo_file_ids IS NOT NULL AND photo_file_ids NOT IN ('[]', 'null')"
+                )
+                for post_id, raw in res.fetchall():
+                    file_ids = list(dict.fromkeys(json_codec.loads(raw) or []))
+                    for position, file_id in enumerate(file_ids):
+                        await conn.exec_driver_sql(
+                            "INSERT OR IGNORE INTO media (file_unique_id, file_id) VALUES (?, ?)", (file_id, file_id)
+                        )
+                        await conn.exec_driver_sql(
+                            "INSERT OR IGNORE INTO post_media (owner_kind, owner_id, position, media_id) "
+                            "SELECT ?, ?, ?, id FROM media WHERE file_unique_id = ?", (kind, post_id, position, file_id)
+                        )
+                    await conn.exec_driver_sql(f"UPDATE {table} SET photo_file_ids = '[]' WHERE id = ?", (post_id,))
+            # Файлы, на которые больше не ссылается ни один пост (посты удалены)
+            await conn.exec_driver_sql("DELETE FROM media WHERE id NOT IN (SELECT media_id FROM post_media)")
+        except Exception:
+            pass
+        # Индексы: create_all создаёт их только вместе с новыми таблицами,
+        # для уже существующих таблиц досоздаём по одному
+        def create_indexes(sync_conn):
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    try:
+                        index.create(sync_conn, checkfirst=True)
+                    except Exception:
+                        pass
+        await conn.run_sync(create_indexes)
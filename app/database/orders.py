@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import select, update
+from app.database.models import Order
+from app.database.unit_of_work import session_scope, after_commit
+
+AWAITING = 'awaiting'
+CONFIRMED = 'confirmed'
+REJECTED = 'rejected'
+EXPIRED = 'expired'
+
+# Горячий кэш заказов, ожидающих модерации: order_id -> payload
+_awaiting: dict[str, dict] = {}
+_awaiting_loaded = False
+
+
+def _forget(order_ids):
+    for order_id in order_ids:
+        _awaiting.pop(order_id, None)
+
+
+async def _ensure_loaded():
+    global _awaiting_loaded
+    if _awaiting_loaded:
+        return
+    async with session_scope() as session:
+        rows = await session.execute(select(Order.id, Order.payload).where(Order.status == AWAITING))
+        for order_id, payload in rows:
+            _awaiting.setdefault(order_id, payload)
+    _awaiting_loaded = True
+
+
+async def create_order(order_id: str, payload: dict) -> None:
+    """Сохраняет заказ в статусе awaiting. payload — то, что раньше лежало в pending_orders."""
+    now = datetime.now()
+    async with session_scope() as session:
+        session.add(Order(
+            id=order_id,
+            order_type=payload.get('order_type', 'publication'),
+            status=AWAITING,
+            user_id=payload['user_id'],
+            payload=payload,
+            created_at=now,
+            updated_at=now,
+        ))
+    after_commit(partial(_awaiting.__setitem__, order_id, payload))
+
+
+async def get_awaiting_order(order_id: str) -> dict | None:
+    await _ensure_loaded()
+    return _awaiting.get(order_id)
+
+
+async def transition_order(order_id: str, to_status: str, from_status: str = AWAITING) -> dict | None:
+    """Атомарно переводит заказ из from_status в to_status.
+
+    Возвращает payload, если переход выполнен этим вызовом, иначе None —
+    заказа нет или его уже обработал другой админ.
+    """
+    async with session_scope() as session:
+        res = await session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == from_status)
+            .values(status=to_status, updated_at=datetime.now())
+            .returning(Order.payload)
+        )
+        payload = res.scalar_one_or_none()
+    if from_status == AWAITING:
+        after_commit(partial(_awaiting.pop, order_id, None))
+    return payload
+
+
+async def list_orders(status: str = AWAITING, limit: int = 50):
+    async with session_scope() as session:
+        orders = await session.scalars(
+            select(Order).where(Order.status == status).order_by(Order.created_at.desc()).limit(limit)
+        )
+        return orders.all()
+
+
+async def expire_orders(older_than: timedelta) -> int:
+    """Помечает expired заказы, которые висят в awaiting дольше older_than."""
+    cutoff = datetime.now() - older_than
+    async with session_scope() as session:
+        res = await session.execute(
+            update(Order)
+            .where(Order.status == AWAITING, Order.created_at < cutoff)
+            .values(status=EXPIRED, updated_at=datetime.now())
+            .returning(Order.id)
+        )
+        expired = res.scalars().all()
+    after_commit(partial(_forget, expired))
+    return len(expired)
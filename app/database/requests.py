@@ -1,92 +1,133 @@
-import os
 from datetime import datetime
-from sqlalchemy import select
-from app.database.models import async_session, PendingPost, ScheduledPost, LastMessage, PostIsPinned, BroadcastPost, BroadcastConfig
+from functools import partial
+from sqlalchemy import select, delete, insert, update, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import set_committed_value
+from app.database.models import PendingPost, ScheduledPost, LastMessage, PostIsPinned, BroadcastPost, BroadcastConfig
+from app.database.unit_of_work import session_scope, after_commit
+from app.database import media
+from app.utils.publish_queue import publish_queue
+from app.utils.broadcast_planner import broadcast_planner
+from app.settings import get_settings
+
+
+def _naive_msk(dt: datetime) -> datetime:
+    """В БД время хранится без tz (по Москве) — приводим аргумент к тому же виду."""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(get_settings().tz).replace(tzinfo=None)
 
 
 async def get_pin_info(post_id: int):
-    async with async_session() as session:
+    async with session_scope() as session:
         existing = await session.scalar(select(PostIsPinned).where(PostIsPinned.post_id == post_id))
         return existing.pinned if existing else False
 
 
+async def get_pin_infos(message_ids: list[int]) -> dict[int, bool]:
+    """Состояние закрепа для пачки сообщений одним запросом."""
+    if not message_ids:
+        return {}
+    async with session_scope() as session:
+        rows = await session.execute(
+            select(PostIsPinned.post_id, PostIsPinned.pinned).where(PostIsPinned.post_id.in_(set(message_ids)))
+        )
+        return {post_id: pinned for post_id, pinned in rows}
+
+
 async def set_pin_info(post_id: int, pinned: bool):
-    async with async_session() as session:
-        async with session.begin():
-            existing = await session.scalar(select(PostIsPinned).where(PostIsPinned.post_id == post_id).with_for_update())
-            if existing:
-                existing.pinned = pinned
-                session.add(existing)
-            else:
-                session.add(PostIsPinned(post_id=post_id, pinned=pinned))
-        await session.commit()
+    async with session_scope() as session:
+        existing = await session.scalar(select(PostIsPinned).where(PostIsPinned.post_id == post_id).with_for_update())
+        if existing:
+            existing.pinned = pinned
+            session.add(existing)
+        else:
+            session.add(PostIsPinned(post_id=post_id, pinned=pinned))
+
+
+# Время последней публикации в основной чат хранится одной строкой (id=1) и кэшируется в памяти
+LAST_MESSAGE_ROW_ID = 1
+_last_message_cache: dict[str, datetime | None] = {}
 
 
 async def get_last_message_time():
-    async with async_session() as session:
-        messages = await session.scalars(select(LastMessage))
-        res = [[msg.id, msg.time] for msg in messages]
-        await session.commit()
-        return None if not res else max(res)[1]
+    if 'time' not in _last_message_cache:
+        async with session_scope() as session:
+            row = await session.get(LastMessage, LAST_MESSAGE_ROW_ID)
+            _last_message_cache['time'] = row.time if row else None
+    return _last_message_cache['time']
 
 
 async def add_last_message_time(time):
-    async with async_session() as session:
-        session.add(LastMessage(time=time))
-        await session.commit()
+    stmt = sqlite_insert(LastMessage).values(id=LAST_MESSAGE_ROW_ID, time=time)
+    stmt = stmt.on_conflict_do_update(index_elements=[LastMessage.id], set_={'time': stmt.excluded.time})
+    async with session_scope() as session:
+        await session.execute(stmt)
+    after_commit(partial(_last_message_cache.__setitem__, 'time', time))
 
 
 async def delete_last_messages():
-    async with async_session() as session:
-        await session.delete(LastMessage)
-        await session.commit()
+    async with session_scope() as session:
+        await session.execute(delete(LastMessage))
+    after_commit(partial(_last_message_cache.__setitem__, 'time', None))
+
 
+async def add_or_update_pending_post(content_type: str, text: str, photo_file_ids: list[str], media_group_id: int = 0, chat_id: int | None = None, entities: list | None = None,
+                                     photo_unique_ids: list[str] | None = None):
+    """Добавляет отложенный пост; часть уже сохранённого альбома дописывается к нему.
 
-async def add_or_update_pending_post(content_type: str, text: str, photo_file_ids: list[str], media_group_id: int = 0, chat_id: int | None = None, entities: list | None = None):
-    post = PendingPost(
+    Строка альбома — один атомарный INSERT ... ON CONFLICT по уникальному частичному индексу
+    media_group_id != 0, фото дописываются в post_media (см. media.link_media) — без чтения строки
+    и гонок между частями. photo_unique_ids — file_unique_id тех же фото, по ним фото дедуплицируются.
+    """
+    stmt = sqlite_insert(PendingPost).values(
         content_type=content_type,
         text=text,
-        photo_file_ids=photo_file_ids,
+        photo_file_ids=[],  # фото хранятся в post_media
         media_group_id=media_group_id if media_group_id else 0,
-        chat_id=chat_id or int(os.getenv('MAIN_CHAT_ID', 0)),
+        chat_id=chat_id or get_settings().main_chat_id,
         entities=entities or []
     )
-
-    async with async_session() as session:
-        async with session.begin():
-            # Проверяем существование с lock (with_for_update)
-            existing = await session.scalar(
-                select(PendingPost)
-                .where(PendingPost.media_group_id == post.media_group_id,
-                       PendingPost.media_group_id != 0)
-                .with_for_update()
-            )
-            if existing:
-                # Обновляем существующий: добавляем новые file_ids
-                existing.photo_file_ids.extend(photo_file_ids)
-                existing.text = text or existing.text  # Сохраняем caption, если новый
-                if chat_id:
-                    existing.chat_id = chat_id
-                if entities is not None:
-                    existing.entities = entities
-                session.add(existing)
-            else:
-                session.add(post)
-        await session.commit()
+    set_ = {
+        # Сохраняем caption, если новый
+        'text': func.coalesce(func.nullif(stmt.excluded.text, ''), PendingPost.text),
+    }
+    if chat_id:
+        set_['chat_id'] = stmt.excluded.chat_id
+    if entities is not None:
+        set_['entities'] = stmt.excluded.entities
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PendingPost.media_group_id],
+        index_where=PendingPost.media_group_id != 0,
+        set_=set_,
+    ).returning(PendingPost.id)
+    async with session_scope() as session:
+        post_id = (await session.execute(stmt)).scalar_one()
+        await media.link_media(session, media.PENDING, post_id, media.media_items(photo_file_ids, photo_unique_ids),
+                               append=True)
 
 
 async def get_pending_posts():
-    async with async_session() as session:
+    async with session_scope() as session:
         posts = await session.scalars(select(PendingPost))
-        return posts.all()
+        return await media.attach_media(session, media.PENDING, posts.all())
+
+
+async def get_random_pending_post():
+    """Случайный пост из очереди — выбор в SQL, без загрузки всей очереди."""
+    async with session_scope() as session:
+        post = await session.scalar(select(PendingPost).order_by(func.random()).limit(1))
+        if post:
+            await media.attach_media(session, media.PENDING, [post])
+        return post
 
 
 async def delete_pending_post(post_id: int):
-    async with async_session() as session:
+    async with session_scope() as session:
         post = await session.get(PendingPost, post_id)
         if post:
             await session.delete(post)
-            await session.commit()
+            await media.unlink_media(session, media.PENDING, [post_id])
             return True
         return False
 
@@ -103,83 +144,148 @@ async def add_or_update_scheduled_post(
     delete_time: datetime | None = None,
     post_id: int = 0,
     chat_id: int | None = None,
-    entities: list | None = None
+    entities: list | None = None,
+    photo_unique_ids: list[str] | None = None
 ):
     if message_ids is None:
         message_ids = []
-    if not photo_file_ids:
-        photo_file_ids = []
+    items = media.media_items(photo_file_ids, photo_unique_ids)
     post = ScheduledPost(
         content_type=content_type,
         text=text,
-        photo_file_ids=photo_file_ids.copy(),  # копируем список во избежание мутации аргумента
+        photo_file_ids=[],  # фото хранятся в post_media
         scheduled_time=scheduled_time,
         media_group_id=media_group_id or 0,
         is_published=is_published,
         message_ids=message_ids.copy(),
         unpin_time=unpin_time,
         delete_time=delete_time,
-        chat_id=chat_id or int(os.getenv('MAIN_CHAT_ID', 0)),
+        chat_id=chat_id or get_settings().main_chat_id,
         entities=entities or []
     )
 
-    async with async_session() as session:
-        async with session.begin():
-            existing = await session.scalar(
-                select(ScheduledPost)
-                .where(
-                    ScheduledPost.id == post_id
-                )
-                .with_for_update()
+    async with session_scope() as session:
+        existing = await session.scalar(
+            select(ScheduledPost)
+            .where(
+                ScheduledPost.id == post_id
             )
-            if existing:
-                # Обновляем список photo_file_ids, добавляя новые уникальные элементы
-                updated_ids = existing.photo_file_ids or []
-                if photo_file_ids:
-                    for pid in photo_file_ids:
-                        if pid not in updated_ids:
-                            updated_ids.append(pid)
-                existing.photo_file_ids = updated_ids or existing.photo_file_ids
-
-                # Обновляем другие поля, если переданы значения
-
-                existing.text = text or existing.text
-                existing.scheduled_time = scheduled_time or existing.scheduled_time
-                existing.is_published = is_published
-                existing.message_ids = message_ids.copy() or existing.message_ids
-                existing.unpin_time = unpin_time or existing.unpin_time
-                existing.delete_time = delete_time or existing.delete_time
-                existing.chat_id = chat_id or existing.chat_id
-                if entities is not None:
-                    existing.entities = entities
-
-                session.add(existing)
-            else:
-                session.add(post)
-
-        await session.commit()
+            .with_for_update()
+        )
+        if existing:
+            # Обновляем другие поля, если переданы значения
+
+            existing.text = text or existing.text
+            existing.scheduled_time = scheduled_time or existing.scheduled_time
+            existing.is_published = is_published
+            existing.message_ids = message_ids.copy() or existing.message_ids
+            existing.unpin_time = unpin_time or existing.unpin_time
+            existing.delete_time = delete_time or existing.delete_time
+            existing.chat_id = chat_id or existing.chat_id
+            if entities is not None:
+                existing.entities = entities
+
+            session.add(existing)
+            target = existing
+        else:
+            session.add(post)
+            target = post
+        await session.flush()
+        # Новые фото дописываются к уже привязанным, повторы отсекает уникальный индекс post_media
+        await media.link_media(session, media.SCHEDULED, target.id, items, append=True)
+        # Запоминаем до commit — после него атрибуты будут expired
+        target_id, published, run_at = target.id, target.is_published, target.scheduled_time
+
+    # Держим очередь публикаций в синхронизации с БД
+    if published:
+        after_commit(partial(publish_queue.discard, target_id))
+    else:
+        after_commit(partial(publish_queue.schedule, target_id, run_at))
+    return target_id
+
+
+async def add_scheduled_posts(posts: list[dict]) -> list[int]:
+    """Пакетное создание запланированных постов.
+
+    posts — словари с полями ScheduledPost (content_type обязателен, photo_unique_ids — по желанию).
+    Все строки пишутся одной транзакцией одним executemany, очередь публикаций уведомляется один раз.
+    """
+    if not posts:
+        return []
+    default_chat = get_settings().main_chat_id
+    rows = [{
+        'content_type': p['content_type'],
+        'text': p.get('text'),
+        'photo_file_ids': [],  # фото хранятся в post_media
+        'scheduled_time': p.get('scheduled_time'),
+        'media_group_id': p.get('media_group_id') or 0,
+        'is_published': False,
+        'message_ids': [],
+        'unpin_time': p.get('unpin_time'),
+        'delete_time': p.get('delete_time'),
+        'chat_id': p.get('chat_id') or default_chat,
+        'entities': p.get('entities') or [],
+    } for p in posts]
+    async with session_scope() as session:
+        res = await session.execute(
+            insert(ScheduledPost).returning(ScheduledPost.id, ScheduledPost.scheduled_time, sort_by_parameter_order=True),
+            rows
+        )
+        created = res.all()
+        await media.link_media_many(session, media.SCHEDULED, {
+            row.id: media.media_items(p.get('photo_file_ids'), p.get('photo_unique_ids'))
+            for row, p in zip(created, posts)
+        })
+    after_commit(partial(publish_queue.schedule_many, [(row.id, row.scheduled_time) for row in created]))
+    return [row.id for row in created]
 
 
 async def get_scheduled_post(post_id: int):
-    async with async_session() as session:
+    async with session_scope() as session:
         post = await session.scalar(select(ScheduledPost).where(ScheduledPost.id == post_id))
+        await media.attach_media(session, media.SCHEDULED, [post])
         return post
 
 
 async def get_scheduled_posts():
-    async with async_session() as session:
+    async with session_scope() as session:
         posts = await session.scalars(select(ScheduledPost))
-        return posts.all()
+        return await media.attach_media(session, media.SCHEDULED, posts.all())
+
+
+async def get_scheduled_posts_by_ids(post_ids: list[int]):
+    if not post_ids:
+        return []
+    async with session_scope() as session:
+        posts = await session.scalars(select(ScheduledPost).where(ScheduledPost.id.in_(set(post_ids))))
+        return await media.attach_media(session, media.SCHEDULED, posts.all())
+
+
+async def get_published_scheduled_posts():
+    async with session_scope() as session:
+        posts = await session.scalars(select(ScheduledPost).where(ScheduledPost.is_published == True))
+        return await media.attach_media(session, media.SCHEDULED, posts.all())
+
+
+async def get_unpublished_scheduled_posts():
+    async with session_scope() as session:
+        posts = await session.scalars(
+            select(ScheduledPost)
+            .where(ScheduledPost.is_published == False)
+            .order_by(ScheduledPost.scheduled_time)
+        )
+        return await media.attach_media(session, media.SCHEDULED, posts.all())
 
 
 async def delete_scheduled_post(post_id: int):
-    async with async_session() as session:
+    async with session_scope() as session:
         post = await session.get(ScheduledPost, post_id)
         if post:
             await session.delete(post)
-            await session.commit()
-            return True
-        return False
+            await media.unlink_media(session, media.SCHEDULED, [post_id])
+    # Из очереди — только после commit: при откате пост остаётся и должен опубликоваться
+    after_commit(partial(publish_queue.discard, post_id))
+    return post is not None
 
 
 async def add_broadcast_post(
@@ -194,7 +300,9 @@ async def add_broadcast_post(
     mode: str = 'full',
     active_start_min: int | None = None,
     active_end_min: int | None = None,
-    entities: list | None = None
+    entities: list | None = None,
+    photo_unique_ids: list[str] | None = None,
+    messages_promised: int | None = None
 ):
     if not photo_file_ids:
         photo_file_ids = []
@@ -221,7 +329,7 @@ async def add_broadcast_post(
     post = BroadcastPost(
         content_type=content_type,
         text=text,
-        photo_file_ids=photo_file_ids.copy(),
+        photo_file_ids=[],  # фото хранятся в post_media
         media_group_id=media_group_id or 0,
         next_run_time=next_run_time,
         end_time=end_time,
@@ -231,113 +339,136 @@ async def add_broadcast_post(
         mode=mode,
         active_start_min=active_start_min if active_start_min is not None else 9*60,
         active_end_min=active_end_min if active_end_min is not None else 23*60,
-        entities=entities or []
+        entities=entities or [],
+        messages_promised=messages_promised
     )
-    async with async_session() as session:
-        async with session.begin():
-            session.add(post)
-        await session.commit()
+    items = media.media_items(photo_file_ids, photo_unique_ids)
+    async with session_scope() as session:
+        session.add(post)
+        await session.flush()
+        await media.link_media(session, media.BROADCAST, post.id, items)
+    set_committed_value(post, 'photo_file_ids', [file_id for _, file_id in items])
+    after_commit(partial(broadcast_planner.plan, post))
     return post
 
 
 async def get_active_broadcast_posts():
-    async with async_session() as session:
+    async with session_scope() as session:
         posts = await session.scalars(select(BroadcastPost).where(BroadcastPost.is_active == True))
-        return posts.all()
+        return await media.attach_media(session, media.BROADCAST, posts.all())
+
+
+async def get_due_broadcast_posts(now: datetime):
+    """Активные рассылки, которым пора публиковаться (по индексу ix_broadcast_posts_active_next)."""
+    async with session_scope() as session:
+        posts = await session.scalars(
+            select(BroadcastPost)
+            .where(BroadcastPost.is_active == True, BroadcastPost.next_run_time <= _naive_msk(now))
+            .order_by(BroadcastPost.next_run_time)
+        )
+        return await media.attach_media(session, media.BROADCAST, posts.all())
 
 
 async def update_broadcast_run(post_id: int, next_run_time: datetime | None, last_run_time: datetime, deactivate: bool = False):
-    async with async_session() as session:
-        async with session.begin():
-            bp = await session.get(BroadcastPost, post_id, with_for_update=True)
-            if not bp:
-                return False
-            bp.last_run_time = last_run_time
-            if deactivate:
-                bp.is_active = False
-            else:
-                bp.next_run_time = next_run_time
-            session.add(bp)
-        await session.commit()
+    async with session_scope() as session:
+        bp = await session.get(BroadcastPost, post_id, with_for_update=True)
+        if not bp:
+            return False
+        bp.last_run_time = last_run_time
+        if deactivate:
+            bp.is_active = False
+        else:
+            bp.next_run_time = next_run_time
+        session.add(bp)
+        after_commit(partial(broadcast_planner.plan, bp))
     return True
 
 
+async def update_broadcast_runs(runs: list[dict]):
+    """Пакетный вариант update_broadcast_run: один UPDATE по первичному ключу (executemany) на весь тик.
+
+    runs — словари с ключами id, next_run_time, last_run_time, is_active.
+    """
+    if not runs:
+        return
+    async with session_scope() as session:
+        await session.execute(update(BroadcastPost), runs)
+
+
 async def stop_broadcast(post_id: int):
-    async with async_session() as session:
-        async with session.begin():
-            bp = await session.get(BroadcastPost, post_id, with_for_update=True)
-            if not bp:
-                return False
-            bp.is_active = False
-            session.add(bp)
-        await session.commit()
+    async with session_scope() as session:
+        bp = await session.get(BroadcastPost, post_id, with_for_update=True)
+        if not bp:
+            return False
+        bp.is_active = False
+        session.add(bp)
+    after_commit(partial(broadcast_planner.forget, post_id))
     return True
 
 
 async def set_broadcast_mode(post_id: int, mode: str):
     if mode not in ('full', 'limited'):
         return False
-    async with async_session() as session:
-        async with session.begin():
-            bp = await session.get(BroadcastPost, post_id, with_for_update=True)
-            if not bp:
-                return False
-            bp.mode = mode
-            session.add(bp)
-        await session.commit()
+    async with session_scope() as session:
+        bp = await session.get(BroadcastPost, post_id, with_for_update=True)
+        if not bp:
+            return False
+        bp.mode = mode
+        session.add(bp)
+        after_commit(partial(broadcast_planner.plan, bp))
     return True
 
 
 async def update_broadcast_window(post_id: int, start_min: int, end_min: int):
-    async with async_session() as session:
-        async with session.begin():
-            bp = await session.get(BroadcastPost, post_id, with_for_update=True)
-            if not bp:
-                return False
-            bp.active_start_min = start_min
-            bp.active_end_min = end_min
-            session.add(bp)
-        await session.commit()
+    async with session_scope() as session:
+        bp = await session.get(BroadcastPost, post_id, with_for_update=True)
+        if not bp:
+            return False
+        bp.active_start_min = start_min
+        bp.active_end_min = end_min
+        session.add(bp)
+        after_commit(partial(broadcast_planner.plan, bp))
     return True
 
 
 async def get_broadcast(post_id: int):
-    async with async_session() as session:
-        return await session.get(BroadcastPost, post_id)
+    async with session_scope() as session:
+        bp = await session.get(BroadcastPost, post_id)
+        await media.attach_media(session, media.BROADCAST, [bp])
+        return bp
 
 
 async def list_broadcasts(active_only: bool = False):
-    async with async_session() as session:
+    async with session_scope() as session:
         if active_only:
             posts = await session.scalars(select(BroadcastPost).where(BroadcastPost.is_active == True))
         else:
             posts = await session.scalars(select(BroadcastPost))
-        return posts.all()
+        return await media.attach_media(session, media.BROADCAST, posts.all())
 
 
 async def get_broadcast_config():
-    async with async_session() as session:
+    async with session_scope() as session:
         cfg = await session.scalar(select(BroadcastConfig).limit(1))
         return cfg
 
 
 async def upsert_broadcast_config(enabled: bool, start_min: int | None = None, end_min: int | None = None):
-    async with async_session() as session:
-        async with session.begin():
-            cfg = await session.scalar(select(BroadcastConfig).limit(1).with_for_update())
-            if not cfg:
-                cfg = BroadcastConfig(
-                    enabled=enabled,
-                    active_start_min=start_min if start_min is not None else 9*60,
-                    active_end_min=end_min if end_min is not None else 23*60
-                )
-                session.add(cfg)
-            else:
-                cfg.enabled = enabled
-                if start_min is not None:
-                    cfg.active_start_min = start_min
-                if end_min is not None:
-                    cfg.active_end_min = end_min
-                session.add(cfg)
-        await session.commit()
+    async with session_scope() as session:
+        cfg = await session.scalar(select(BroadcastConfig).limit(1).with_for_update())
+        if not cfg:
+            cfg = BroadcastConfig(
+                enabled=enabled,
+                active_start_min=start_min if start_min is not None else 9*60,
+                active_end_min=end_min if end_min is not None else 23*60
+            )
+            session.add(cfg)
+        else:
+            cfg.enabled = enabled
+            if start_min is not None:
+                cfg.active_start_min = start_min
+            if end_min is not None:
+                cfg.active_end_min = end_min
+            session.add(cfg)
+    after_commit(partial(broadcast_planner.set_config, cfg))
     return True
@@ -0,0 +1,101 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import async_session
+
+
+class UnitOfWork:
+    __slots__ = ('session', 'after_commit', 'active', 'task')
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.after_commit: list[Callable[[], None]] = []
+        self.active = True
+        self.task = asyncio.current_task()
+
+
+def _active() -> UnitOfWork | None:
+    # Задачи, созданные внутри блока (воркеры publisher, загрузчик fsm_storage и т.п.), наследуют
+    # копию контекста. AsyncSession нельзя использовать из нескольких задач сразу, поэтому блок
+    # виден только задаче, которая его открыла; остальные работают со своей сессией
+    uow = _current.get()
+    if uow is None or not uow.active or uow.task is not asyncio.current_task():
+        return None
+    return uow
+
+
+_current: ContextVar[UnitOfWork | None] = ContextVar('unit_of_work', default=None)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """Одна сессия и одна транзакция на весь тик планировщика или хендлер.
+
+    Все функции app.database.* внутри блока берут эту сессию через session_scope():
+    изменения копятся и сбрасываются пачкой (autoflush / commit в конце), а не
+    коммитятся каждой функцией отдельно. Вложенный вызов переиспользует внешний блок.
+    Перед каждым запросом к Telegram накопленное фиксируется (см. commit) — транзакция
+    записи SQLite не держится, пока бот ждёт сеть или flood control.
+    """
+    outer = _active()
+    if outer is not None:
+        yield outer.session
+        return
+    async with async_session() as session:
+        uow = UnitOfWork(session)
+        token = _current.set(uow)
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            uow.active = False
+            _current.reset(token)
+    for callback in uow.after_commit:
+        callback()
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Сессия для функции репозитория: внутри unit_of_work — общая (без commit),
+    иначе — собственная, с commit при выходе, как раньше."""
+    uow = _active()
+    if uow is not None:
+        yield uow.session
+        return
+    async with async_session() as session:
+        yield session
+        await session.commit()
+
+
+async def commit():
+    """Зафиксировать накопленное в текущем unit_of_work сейчас и выполнить его after_commit.
+
+    Вызывается перед сетевыми запросами бота (CommitBeforeRequestMiddleware). Дальнейшие
+    изменения блока идут уже в новой транзакции: исключение после запроса откатит только их.
+    """
+    uow = _active()
+    if uow is None or not uow.session.in_transaction():
+        return
+    await uow.session.commit()
+    callbacks, uow.after_commit = uow.after_commit, []
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(callback: Callable[[], None]):
+    """Выполнить callback после фиксации изменений (кэши, очередь публикаций).
+
+    Внутри unit_of_work откладывается до его commit и отбрасывается при откате.
+    """
+    uow = _active()
+    if uow is not None:
+        uow.after_commit.append(callback)
+    else:
+        callback()
@@ -5,9 +5,10 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from app.database import admin_crud as req
 from app.database import requests as breq
-import os
+from app.database import orders as orders_repo
+from app.database import deliveries as deliveries_repo
+from app.settings import Settings
 from datetime import datetime, timedelta
-import pytz
 
 router1 = Router()
 
@@ -21,8 +22,8 @@ class AdminBroadcast(StatesGroup):
     waiting_content = State()
 
 
-async def is_admin(username):
-    x = await req.is_admin(username)
+async def is_admin(username, user_id=None):
+    x = await req.is_admin(username, user_id)
     return x
 
 
@@ -30,7 +31,7 @@ async def is_admin(username):
 async def all_admins(message: Message):
     if message.chat.type != 'private':
         return
-    a = await is_admin(message.from_user.username)
+    a = await is_admin(message.from_user.username, message.from_user.id)
     if a[0]:
         admins = await req.all_admins()
         await message.answer('Список администраторов\n'+'\n'.join(admins[0]))
@@ -42,7 +43,7 @@ async def delete_admin(message: Message):
         return
     try:
         username = message.text.split()[1].strip('@')
-        ad = await is_admin(message.from_user.username)
+        ad = await is_admin(message.from_user.username, message.from_user.id)
         ad2 = await is_admin(username)
         if username==message.from_user.username:
             await message.answer('Вы не можете удалить себя из списка администраторов')
@@ -63,7 +64,7 @@ async def set_admin(message: Message):
     if message.chat.type != 'private':
         return
     try:
-        ad = await is_admin(message.from_user.username)
+        ad = await is_admin(message.from_user.username, message.from_user.id)
         if ad[0] and ad[2]:
             username = message.text.split()[1].strip('@')
             await req.set_admin(username)
@@ -72,11 +73,36 @@ async def set_admin(message: Message):
         await message.answer(f'Ошибка в формате сообщения')
 
 
+@router1.message(Command('orders'))  # /orders [awaiting|confirmed|rejected|expired]
+async def orders_list(message: Message):
+    if message.chat.type != 'private':
+        return
+    ad = await is_admin(message.from_user.username, message.from_user.id)
+    if not ad[0]:
+        return
+    parts = message.text.split()
+    status = parts[1] if len(parts) > 1 else orders_repo.AWAITING
+    if status not in (orders_repo.AWAITING, orders_repo.CONFIRMED, orders_repo.REJECTED, orders_repo.EXPIRED):
+        await message.answer('Формат: /orders [awaiting|confirmed|rejected|expired]')
+        return
+    orders = await orders_repo.list_orders(status)
+    if not orders:
+        await message.answer(f'Заказов со статусом {status} нет')
+        return
+    lines = []
+    for o in orders:
+        p = o.payload or {}
+        username = p.get('user_username')
+        price = p.get('price') if o.order_type == 'broadcast' else p.get('total')
+        lines.append(f"#{o.id[:8]} | {o.order_type} | @{username} ({o.user_id}) | {price if price is not None else '—'}₽ | {o.created_at:%d.%m %H:%M}")
+    await message.answer(f'Заказы ({status}):\n' + '\n'.join(lines))
+
+
 @router1.message(Command('broadcast_list'))
 async def broadcast_list(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     posts = await breq.list_broadcasts(active_only=True)
@@ -131,7 +157,7 @@ async def broadcast_list(message: Message):
 async def broadcast_show(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     try:
@@ -178,11 +204,44 @@ async def broadcast_show(message: Message):
         await message.answer(header + '\n(контент отсутствует или не поддерживается)')
 
 
+@router1.message(Command('broadcast_stats'))  # /broadcast_stats [id]
+async def broadcast_stats(message: Message):
+    if message.chat.type != 'private':
+        return
+    ad = await is_admin(message.from_user.username, message.from_user.id)
+    if not ad[0]:
+        return
+    parts = message.text.split()
+    try:
+        bid = int(parts[1]) if len(parts) > 1 else None
+    except ValueError:
+        await message.answer('Формат: /broadcast_stats [id]')
+        return
+    if bid is None:
+        summary = await deliveries_repo.delivery_summary(active_only=True)
+    else:
+        summary = await deliveries_repo.delivery_summary([bid])
+    if not summary:
+        await message.answer('Не найдена' if bid is not None else 'Активных рассылок нет')
+        return
+    lines = []
+    for s in summary[:60]:
+        promised = s['promised'] if s['promised'] is not None else '—'
+        avg = f"{s['latency_ms_avg'] / 1000:.1f}с" if s['latency_ms_avg'] is not None else '—'
+        lines.append(f"ID {s['broadcast_id']} | {'ON' if s['is_active'] else 'OFF'} | "
+                     f"доставлено {s['delivered']}/{promised} | ошибок {s['failed']} | "
+                     f"задержка ср. {avg}, макс. {s['latency_ms_max'] / 1000:.1f}с | последняя {s['last_actual_at'] or '—'}")
+    if bid is not None:
+        for d in await deliveries_repo.list_deliveries(bid, limit=10):
+            lines.append(f"  {d.planned_at} → {d.actual_at} ({d.latency_ms} мс) {'ok' if d.delivered else 'FAIL'}")
+    await message.answer('Доставка рассылок:\n' + '\n'.join(lines))
+
+
 @router1.message(Command('broadcast_stop'))
 async def broadcast_stop(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     try:
@@ -197,7 +256,7 @@ async def broadcast_stop(message: Message):
 async def broadcast_mode(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     try:
@@ -216,7 +275,7 @@ async def broadcast_mode(message: Message):
 async def broadcast_window(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     try:
@@ -241,7 +300,7 @@ async def broadcast_window(message: Message):
 async def broadcast_global_window(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     try:
@@ -263,7 +322,7 @@ async def broadcast_global_window(message: Message):
 async def broadcast_global_off(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     await breq.upsert_broadcast_config(False)
@@ -275,7 +334,7 @@ async def broadcast_global_off(message: Message):
 async def broadcast_start(message: Message, state: FSMContext):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     await state.clear()
@@ -298,8 +357,8 @@ async def broadcast_get_interval(message: Message, state: FSMContext):
 
 
 @router1.message(AdminBroadcast.waiting_start)
-async def broadcast_get_start(message: Message, state: FSMContext):
-    tz = pytz.timezone('Europe/Moscow')
+async def broadcast_get_start(message: Message, state: FSMContext, settings: Settings):
+    tz = settings.tz
     txt = (message.text or '').strip()
     try:
         if txt.lower() in ('now', '/now'):
@@ -307,7 +366,7 @@ async def broadcast_get_start(message: Message, state: FSMContext):
         else:
             start_dt = datetime.strptime(txt, '%H:%M_%d-%m-%Y')
             if start_dt.tzinfo is None:
-                start_dt = tz.localize(start_dt)
+                start_dt = start_dt.replace(tzinfo=tz)
         await state.update_data(bc_start=start_dt)
         await state.set_state(AdminBroadcast.waiting_end)
         await message.answer('Время окончания: HH:MM_DD-MM-YYYY')
@@ -316,12 +375,12 @@ async def broadcast_get_start(message: Message, state: FSMContext):
 
 
 @router1.message(AdminBroadcast.waiting_end)
-async def broadcast_get_end(message: Message, state: FSMContext):
-    tz = pytz.timezone('Europe/Moscow')
+async def broadcast_get_end(message: Message, state: FSMContext, settings: Settings):
+    tz = settings.tz
     try:
         end_dt = datetime.strptime(message.text.strip(), '%H:%M_%d-%m-%Y')
         if end_dt.tzinfo is None:
-            end_dt = tz.localize(end_dt)
+            end_dt = end_dt.replace(tzinfo=tz)
         data = await state.get_data()
         start_dt = data.get('bc_start')
         if not start_dt or end_dt <= start_dt:
@@ -371,10 +430,10 @@ async def broadcast_get_window(message: Message, state: FSMContext):
 
 
 @router1.message(AdminBroadcast.waiting_content)
-async def broadcast_flow_content(message: Message, state: FSMContext):
+async def broadcast_flow_content(message: Message, state: FSMContext, settings: Settings):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     data = await state.get_data()
@@ -382,6 +441,7 @@ async def broadcast_flow_content(message: Message, state: FSMContext):
     content_type = None
     text = ''
     file_ids = []
+    unique_ids = []
     media_group_id = 0
     if message.text:
         content_type = 'text'
@@ -390,6 +450,7 @@ async def broadcast_flow_content(message: Message, state: FSMContext):
         content_type = 'photo'
         text = message.caption or ''
         file_ids = [message.photo[-1].file_id]
+        unique_ids = [message.photo[-1].file_unique_id]
     else:
         await message.answer('Нужен текст или фото')
         return
@@ -399,7 +460,7 @@ async def broadcast_flow_content(message: Message, state: FSMContext):
         await message.answer(f'Слишком длинный текст. Лимит: {max_len} символов. Сейчас: {len(text)}. Отправьте заново.')
         return
     try:
-        free_chat = int(os.getenv('FREE_CHAT_ID','0'))
+        free_chat = settings.free_chat_id
         start_dt = data['bc_start']
         end_dt = data['bc_end']
         interval = data['bc_interval']
@@ -410,6 +471,7 @@ async def broadcast_flow_content(message: Message, state: FSMContext):
             content_type=content_type,
             text=text,
             photo_file_ids=file_ids,
+            photo_unique_ids=unique_ids,
             media_group_id=media_group_id,
             next_run_time=start_dt.replace(tzinfo=None),
             end_time=end_dt.replace(tzinfo=None),
@@ -430,7 +492,7 @@ async def broadcast_flow_content(message: Message, state: FSMContext):
 async def broadcast_manual_deprecated(message: Message):
     if message.chat.type != 'private':
         return
-    ad = await is_admin(message.from_user.username)
+    ad = await is_admin(message.from_user.username, message.from_user.id)
     if not ad[0]:
         return
     await message.answer('Команда устарела. Используйте /broadcast для пошагового создания рассылки.')
@@ -1,4 +1,3 @@
-import os
 from aiogram import Router, Bot
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -8,6 +7,8 @@ import app.database.requests as req
 from datetime import datetime, timedelta
 from app.handlers.admin_handlers import is_admin
 from app.utils.scheduler import update_unpin_or_delete_task
+from app.middlewares.flood_control import flood_control
+from app.settings import Settings
 
 
 router = Router()
@@ -36,7 +37,7 @@ def extract_entities(message: Message):
 
 @router.message(Command("help"))
 async def help_command(message: Message):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if message.chat.type != 'private' or not x[0]:
         return
     help_text = (
@@ -56,11 +57,14 @@ async def help_command(message: Message):
 /delete_scheduled_post <id> – удалить запланированный (и из чата, если уже опубликован).
 /pin_post <id> [HH:MM DD-MM-YYYY] – (пере)закрепить; если время не указано – закрепить навсегда.
 /chats – показать текущие chat_id из .env.
+/send_stats – очередь отправки и ожидания из-за лимитов Telegram.
+/orders [awaiting|confirmed|rejected|expired] – заказы по статусу (по умолчанию — ожидающие модерации).
 
 Рассылки (broadcast) – повторная публикация поста по интервалу в бесплатный чат:
 /broadcast — создать рассылку (пошагово: интервал → старт → конец → режим → окно → контент).
 /broadcast_list – список активных рассылок (ID, статус, режим, окно, next, end).
 /broadcast_stop <id> – остановить рассылку определённого поста по айди.
+/broadcast_stats [id] – доставлено/оплачено, ошибки и задержка публикаций по рассылкам (с id — плюс последние отправки).
 /broadcast_mode <id> <full|limited> – установить посту по айди режим публикации 24/7 или дневной.
 /broadcast_window <id> <HH:MM-HH:MM> – установить локальное дневное окно рассылки для определённого поста по айди.
 /broadcast_global_window <HH:MM-HH:MM> – включить/обновить глобальное окно для всех постов-рассылок без установленного локального окна.
@@ -96,28 +100,41 @@ limited – только внутри установленного времен
 
 
 @router.message(Command('chats'))
-async def show_chats(message: Message):
-    x = await is_admin(message.from_user.username)
+async def show_chats(message: Message, settings: Settings):
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if message.chat.type != 'private' or not x[0]:
         return
-    admin_chat_id = os.getenv('ADMIN_CHAT_ID')
-    channel_id = os.getenv('CHANNEL_ID')  # Премиум-канал
-    free_chat_id = os.getenv('FREE_CHAT_ID')
-    main_chat_id = os.getenv('MAIN_CHAT_ID')
-    notification_chat = os.getenv('NOTIFICATION_CHAT', admin_chat_id)
     txt = (
-        f"ADMIN_CHAT_ID: {admin_chat_id}\n"
-        f"CHANNEL_ID (премиум): {channel_id}\n"
-        f"FREE_CHAT_ID: {free_chat_id}\n"
-        f"MAIN_CHAT_ID: {main_chat_id}\n"
-        f"NOTIFICATION_CHAT: {notification_chat}"
+        f"ADMIN_CHAT_ID: {settings.admin_chat_id}\n"
+        f"CHANNEL_ID (премиум): {settings.channel_id}\n"
+        f"FREE_CHAT_ID: {settings.free_chat_id}\n"
+        f"MAIN_CHAT_ID: {settings.main_chat_id}\n"
+        f"NOTIFICATION_CHAT: {settings.notification_chat}"
+    )
+    await message.answer(txt)
+
+
+@router.message(Command('send_stats'))
+async def send_stats(message: Message):
+    x = await is_admin(message.from_user.username, message.from_user.id)
+    if message.chat.type != 'private' or not x[0]:
+        return
+    st = flood_control.stats()
+    by_chat = '\n'.join(f"  {chat}: {n}" for chat, n in st['queue_depth_by_chat'].items()) or '  —'
+    txt = (
+        f"Очередь отправки: {st['queue_depth']}\n"
+        f"По чатам:\n{by_chat}\n"
+        f"Отправлено: {st['sent']}\n"
+        f"RetryAfter (429): {st['retry_after_hits']}\n"
+        f"Среднее ожидание: {st['avg_wait']:.2f} с\n"
+        f"Максимальное ожидание: {st['max_wait']:.2f} с"
     )
     await message.answer(txt)
 
 
 @router.message(Command('all_pending_posts'))
 async def all_pending_posts(message: Message):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if not x[0] or message.chat.type != 'private':
         return
     posts = await req.get_pending_posts()
@@ -137,7 +154,7 @@ async def all_pending_posts(message: Message):
 
 @router.message(Command('delete_pending_post'))
 async def delete_pending_post(message: Message):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if not x[0] or message.chat.type != 'private':
         return
     try:
@@ -150,7 +167,7 @@ async def delete_pending_post(message: Message):
 
 @router.message(Command('all_scheduled_posts'))
 async def all_scheduled_posts(message: Message):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if not x[0] or message.chat.type != 'private':
         return
     posts = await req.get_scheduled_posts()
@@ -173,7 +190,7 @@ async def all_scheduled_posts(message: Message):
 
 
 async def delete_scheduled_post(message: Message, bot: Bot, chat_id):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if not x[0] or message.chat.type != 'private':
         return
     try:
@@ -190,7 +207,7 @@ async def delete_scheduled_post(message: Message, bot: Bot, chat_id):
 
 
 async def pin_post(message: Message, bot: Bot, chat_id, scheduler):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if not x[0] or message.chat.type != 'private':
         return
     try:
@@ -205,7 +222,7 @@ async def pin_post(message: Message, bot: Bot, chat_id, scheduler):
         await req.add_or_update_scheduled_post(content_type=post.content_type, unpin_time=unpin, post_id=post.id,
                                                is_published=post.is_published)
         if post.is_published:
-            await update_unpin_or_delete_task(bot, target_chat, scheduler)
+            await update_unpin_or_delete_task(bot, target_chat, scheduler, [post.id])
         await message.answer('Настройки закрепа обновлены')
     except Exception:
         await message.answer('Не удалось закрепить пост')
@@ -217,7 +234,7 @@ class PendingState(StatesGroup):
 
 @router.message(Command('pending'))
 async def store_pending_post(message: Message, state: FSMContext):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if x[0] and message.chat.type == 'private':
         await message.answer("Отправьте контент поста (текст и фото, при наличии).")
         await state.set_state(PendingState.content)
@@ -229,6 +246,7 @@ async def second_store_pending_post(message: Message, state: FSMContext, album:
         # Обработка медиа-группы (альбома)
         content_type = 'photo'
         file_ids = [msg.photo[-1].file_id for msg in album if msg.photo]
+        unique_ids = [msg.photo[-1].file_unique_id for msg in album if msg.photo]
         # Caption и entities берём из первого сообщения с подписью
         cap_msg = next((msg for msg in album if msg.caption), None)
         text = cap_msg.caption if cap_msg else ''
@@ -243,7 +261,8 @@ async def second_store_pending_post(message: Message, state: FSMContext, album:
             )
             return
         # передаём entities позиционно для статической проверки
-        await req.add_or_update_pending_post(content_type, text, file_ids, int(media_group_id), None, entities)
+        await req.add_or_update_pending_post(content_type, text, file_ids, int(media_group_id), None, entities,
+                                             photo_unique_ids=unique_ids)
     else:
         # Одиночное сообщение
         media_group_id = message.media_group_id or 0
@@ -251,11 +270,13 @@ async def second_store_pending_post(message: Message, state: FSMContext, album:
             content_type = 'text'
             text = message.text
             file_ids = []
+            unique_ids = []
             entities = extract_entities(message)
         elif message.photo:
             content_type = 'photo'
             text = message.caption or ''
             file_ids = [message.photo[-1].file_id]
+            unique_ids = [message.photo[-1].file_unique_id]
             entities = extract_entities(message)
         else:
             await message.answer("Пожалуйста, отправьте текст или фото.")
@@ -270,7 +291,8 @@ async def second_store_pending_post(message: Message, state: FSMContext, album:
             )
             return
 
-        await req.add_or_update_pending_post(content_type, text, file_ids, media_group_id, None, entities)
+        await req.add_or_update_pending_post(content_type, text, file_ids, media_group_id, None, entities,
+                                             photo_unique_ids=unique_ids)
 
     await message.answer("Пост получен и сохранён.")
     await state.clear()
@@ -285,7 +307,7 @@ class ScheduleState(StatesGroup):
 
 @router.message(Command("schedule"))
 async def start_schedule(message: Message, state: FSMContext):
-    x = await is_admin(message.from_user.username)
+    x = await is_admin(message.from_user.username, message.from_user.id)
     if x[0] and message.chat.type == 'private':
         await message.answer("Отправьте контент поста (текст и фото, при наличии).")
         await state.set_state(ScheduleState.content)
@@ -297,6 +319,7 @@ async def get_content(message: Message, state: FSMContext, album: list[Message]
         # Обработка медиа-группы
         content_type = 'photo'
         file_ids = [msg.photo[-1].file_id for msg in album if msg.photo]
+        unique_ids = [msg.photo[-1].file_unique_id for msg in album if msg.photo]
         cap_msg = next((msg for msg in album if msg.caption), None)
         text = cap_msg.caption if cap_msg else ''  # Caption от первого с текстом
         entities = extract_entities(cap_msg) if cap_msg else []
@@ -313,6 +336,7 @@ async def get_content(message: Message, state: FSMContext, album: list[Message]
             content_type=content_type,
             text=text,
             photo_file_ids=file_ids,
+            photo_unique_ids=unique_ids,
             media_group_id=media_group_id,
             entities=entities
         )
@@ -323,11 +347,13 @@ async def get_content(message: Message, state: FSMContext, album: list[Message]
             content_type = 'text'
             text = message.text
             file_ids = []
+            unique_ids = []
             entities = extract_entities(message)
         elif message.photo:
             content_type = 'photo'
             text = message.caption or ''
             file_ids = [message.photo[-1].file_id]
+            unique_ids = [message.photo[-1].file_unique_id]
             entities = extract_entities(message)
         else:
             await message.answer("Пожалуйста, отправьте текст или фото.")
@@ -346,6 +372,7 @@ async def get_content(message: Message, state: FSMContext, album: list[Message]
             content_type=content_type,
             text=text,
             photo_file_ids=file_ids,
+            photo_unique_ids=unique_ids,
             media_group_id=media_group_id,
             entities=entities
         )
@@ -419,7 +446,8 @@ async def get_delete_time(message: Message, state: FSMContext):
             data['media_group_id'],
             unpin_time=data['unpin_time'],
             delete_time=delete_time,
-            entities=data.get('entities')
+            entities=data.get('entities'),
+            photo_unique_ids=data.get('photo_unique_ids')
         )
         await message.answer("Пост успешно запланирован.")
     except ValueError:
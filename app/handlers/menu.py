@@ -1,7 +1,5 @@
-import os
 from typing import Dict, List
 import uuid
-import dotenv
 from aiogram import Bot, F, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
@@ -10,13 +8,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto, Message, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from app.database import orders as orders_repo
+from app.settings import Settings
 
 
-dotenv.load_dotenv()
-# Загружаем ID чатов из окружения
-ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID', '0'))
-NOTIFICATION_CHAT = int(os.getenv('NOTIFICATION_CHAT', str(ADMIN_CHAT_ID)))
-
 # Быстрые ссылки на наши площадки
 LINKS = {
     'main': 'https://t.me/FreelanceSET',
@@ -51,9 +46,6 @@ def extract_entities(msg: Message) -> list:
         return [entity_to_dict(e) for e in msg.caption_entities]
     return []
 
-# Global storage for pending orders
-pending_orders: Dict[str, Dict] = {}
-
 # Define FSM states for the purchase process
 class Purchase(StatesGroup):
     waiting_check = State()  # Waiting for payment check photo
@@ -784,7 +776,7 @@ async def process_menu_callback(query: CallbackQuery, callback_data: MenuCallbac
         await query.answer()
         return
 @menu_router.message(Broadcast.waiting_check, F.photo)
-async def broadcast_get_check(message: Message, state: FSMContext, bot: Bot):
+async def broadcast_get_check(message: Message, state: FSMContext, bot: Bot, settings: Settings):
     data = await state.get_data()
     photo_id = message.photo[-1].file_id
 
@@ -803,7 +795,7 @@ async def broadcast_get_check(message: Message, state: FSMContext, bot: Bot):
     # Рассчитываем цену и количество сообщений для модераторов
     price = get_broadcast_price(data.get('broadcast_interval_code'), data.get('broadcast_duration_code'), data.get('broadcast_mode'))
     msgs = total_messages(data.get('broadcast_interval_code'), data.get('broadcast_duration_code'), data.get('broadcast_mode'))
-    pending_orders[order_id] = {
+    await orders_repo.create_order(order_id, {
         'order_type': 'broadcast',
         'user_id': message.from_user.id,
         'user_username': message.from_user.username,
@@ -817,12 +809,13 @@ async def broadcast_get_check(message: Message, state: FSMContext, bot: Bot):
         'content_type': data['broadcast_content_type'],
         'text': data['broadcast_text'],
         'file_ids': data['broadcast_file_ids'],
+        'file_unique_ids': data.get('broadcast_unique_ids'),
         'media_group_id': data['broadcast_media_group_id'],
         'entities': data.get('broadcast_entities', []),  # NEW: entities
         'check_photo': photo_id,
         'price': price,
         'messages_total': msgs,
-    }
+    })
     builder = InlineKeyboardBuilder()
     builder.button(text="Подтвердить", callback_data=AdminCallback(action="confirm", order_id=order_id).pack())
     builder.button(text="Отклонить", callback_data=AdminCallback(action="reject", order_id=order_id).pack())
@@ -846,10 +839,10 @@ async def broadcast_get_check(message: Message, state: FSMContext, bot: Bot):
         if data['broadcast_text']:
             # caption_entities поддерживаются только для первого элемента
             media[0].caption_entities = data.get('broadcast_entities') or None
-        await bot.send_media_group(ADMIN_CHAT_ID, media)
+        await bot.send_media_group(settings.admin_chat_id, media)
     else:
-        await bot.send_message(ADMIN_CHAT_ID, data['broadcast_text'] or '(без текста)', entities=data.get('broadcast_entities') or None)
-    await bot.send_photo(ADMIN_CHAT_ID, photo=photo_id, caption=caption, reply_markup=builder.as_markup())
+        await bot.send_message(settings.admin_chat_id, data['broadcast_text'] or '(без текста)', entities=data.get('broadcast_entities') or None)
+    await bot.send_photo(settings.admin_chat_id, photo=photo_id, caption=caption, reply_markup=builder.as_markup())
     contact_builder = InlineKeyboardBuilder()
     contact_builder = add_contact_button(contact_builder)
     await message.answer("Заказ на рассылку отправлен на модерацию.", reply_markup=contact_builder.as_markup())
@@ -864,30 +857,33 @@ async def broadcast_need_photo(message: Message):
 
 # Модификация admin callback для обработки рассылки
 @menu_router.callback_query(AdminCallback.filter())
-async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallback, state: FSMContext, bot: Bot):
+async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallback, state: FSMContext, bot: Bot,
+                                 settings: Settings):
     from datetime import datetime, timedelta
-    import os
-    import pytz
     from app.database import requests as req
 
     order_id = callback_data.order_id
     action = callback_data.action
-    if order_id in pending_orders and pending_orders[order_id].get('order_type') == 'broadcast' and action == 'confirm':
-        from app.database import requests as req
-        from datetime import datetime
-        data = pending_orders.pop(order_id)
-        free_chat = int(os.getenv('FREE_CHAT_ID', '0'))
+    awaiting = await orders_repo.get_awaiting_order(order_id)
+    if awaiting and awaiting.get('order_type') == 'broadcast' and action == 'confirm':
+        data = await orders_repo.transition_order(order_id, orders_repo.CONFIRMED)
+        if data is None:
+            await query.answer("Заказ не найден или уже обработан.")
+            return
+        free_chat = settings.free_chat_id
         await req.add_broadcast_post(
             content_type=data['content_type'],
             text=data['text'],
             photo_file_ids=data['file_ids'],
+            photo_unique_ids=data.get('file_unique_ids'),
             media_group_id=data['media_group_id'],
             next_run_time=data['start_time'],
             end_time=data['broadcast_end'],
             interval_minutes=data['interval_minutes'],
             chat_id=free_chat,
             mode=data.get('mode','full'),
-            entities=data.get('entities') or []
+            entities=data.get('entities') or [],
+            messages_promised=data.get('messages_total')
         )
         try:
             await query.message.edit_caption(caption=(query.message.caption + "\n\nСтатус: Подтверждено"), reply_markup=None)
@@ -922,13 +918,13 @@ async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallb
         return mapping.get(var)
 
     def forever_dt(tz) -> datetime:
-        return tz.localize(datetime.strptime("12:00 31-12-2200", "%H:%M %d-%m-%Y"))
+        return datetime.strptime("12:00 31-12-2200", "%H:%M %d-%m-%Y").replace(tzinfo=tz)
 
     def compute_targets(user_type: str, option: str) -> List[int | str] | List[List[int | str]]:
         # Для пакетов возвращаем список чатов, для обычных — один
-        free_chat = int(os.getenv('FREE_CHAT_ID', '0'))
-        main_chat = int(os.getenv('MAIN_CHAT_ID', '0'))
-        channel = int(os.getenv('CHANNEL_ID', '0'))  # теперь это премиум-канал
+        free_chat = settings.free_chat_id
+        main_chat = settings.main_chat_id
+        channel = settings.channel_id  # теперь это премиум-канал
         if option == '1':
             return [free_chat]
         if option == '2':
@@ -948,13 +944,14 @@ async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallb
 
     await query.answer()
 
-    if order_id in pending_orders:
-        order = pending_orders.pop(order_id)
+    # Переход awaiting -> confirmed атомарный: повторное нажатие или второй админ получат None
+    order = await orders_repo.transition_order(order_id, orders_repo.CONFIRMED) if action == "confirm" else None
+    if order:
         user_id = order['user_id']
         status = "Обработано"
         if action == "confirm":
             # Сохраняем пост(ы) в БД как ScheduledPost по целевым чатам
-            tz = pytz.timezone("Europe/Moscow")
+            tz = settings.tz
             now = datetime.now(tz)
             scheduled_time = now + timedelta(seconds=90)
             selected = order.get('selected_suboptions', {})
@@ -968,11 +965,13 @@ async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallb
             delete_time_base = forever_dt(tz)
 
             targets = compute_targets(user_type, option)
+            # Все посты заказа (цели × поднятия) пишем одной транзакцией
+            post_specs = []
             for chat_id in targets:
                 # unpin_time по правилам для основной публикации:
                 if option == '4':
                     # Пакет 4: закреп только в бесплатном чате на 1 месяц
-                    if chat_id == int(os.getenv('FREE_CHAT_ID', '0')):
+                    if chat_id == settings.free_chat_id:
                         unpin_time = now + timedelta(days=30)
                     else:
                         unpin_time = None
@@ -995,33 +994,37 @@ async def process_admin_callback(query: CallbackQuery, callback_data: AdminCallb
                 delete_time = delete_time_base
 
                 # Основная публикация
-                await req.add_or_update_scheduled_post(
+                post_specs.append(dict(
                     content_type=order['content_type'],
                     text=order['text'],
                     photo_file_ids=order['file_ids'],
+                    photo_unique_ids=order.get('file_unique_ids'),
                     scheduled_time=scheduled_time.replace(tzinfo=None),  # в БД без tz
                     media_group_id=order['media_group_id'] or 0,
                     unpin_time=unpin_time.replace(tzinfo=None) if unpin_time else None,
                     delete_time=delete_time.replace(tzinfo=None) if delete_time else None,
                     chat_id=int(chat_id),
                     entities=order.get('entities') or []
-                )
+                ))
 
                 # Поднятия: дублируем пост boost_count раз, каждые +2 часа, с закрепом на 2 часа
                 for i in range(1, boost_count + 1):
                     st = (now + timedelta(hours=2 * i)).replace(tzinfo=None)
                     unpin_boost = (now + timedelta(hours=2 * i + 2)).replace(tzinfo=None)
-                    await req.add_or_update_scheduled_post(
+                    post_specs.append(dict(
                         content_type=order['content_type'],
                         text=order['text'],
                         photo_file_ids=order['file_ids'],
+                        photo_unique_ids=order.get('file_unique_ids'),
                         scheduled_time=st,
                         media_group_id=order['media_group_id'] or 0,
                         unpin_time=unpin_boost,
                         delete_time=delete_time.replace(tzinfo=None) if delete_time else None,
                         chat_id=int(chat_id),
                         entities=order.get('entities') or []
-                    )
+                    ))
+            await req.add_scheduled_posts(post_specs)
+
 
             # Уведомление пользователю с кнопкой контакта
             kb = InlineKeyboardBuilder(); kb = add_contact_button(kb)
@@ -1039,8 +1042,8 @@ async def process_rejection_reason(message: Message, state: FSMContext, bot: Bot
     data = await state.get_data()
     order_id = data.get('order_id_to_reject')
 
-    if order_id in pending_orders:
-        order = pending_orders.pop(order_id)
+    order = await orders_repo.transition_order(order_id, orders_repo.REJECTED) if order_id else None
+    if order:
         user_id = order['user_id']
 
         # Отправляем пользователю сообщение с причиной
@@ -1100,12 +1103,14 @@ async def invalid_check(message: Message):
 
 # Обработчик поста для обычной публикации (текст или фото)
 @menu_router.message(Purchase.waiting_post, F.photo | F.text)
-async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, album: list | None = None):
+async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, settings: Settings,
+                            album: list | None = None):
     data = await state.get_data()
 
     if album:
         content_type = 'photo'
         file_ids = [msg.photo[-1].file_id for msg in album if msg.photo]
+        unique_ids = [msg.photo[-1].file_unique_id for msg in album if msg.photo]
         cap_msg = next((msg for msg in album if msg.caption), None)
         text = cap_msg.caption if cap_msg else ''
         media_group_id = album[0].media_group_id if album and album[0].media_group_id else 0
@@ -1114,12 +1119,14 @@ async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, album
         content_type = 'photo'
         text = message.caption or ''
         file_ids = [message.photo[-1].file_id]
+        unique_ids = [message.photo[-1].file_unique_id]
         media_group_id = message.media_group_id or 0
         entities = extract_entities(message)
     else:
         content_type = 'text'
         text = message.text or ''
         file_ids = []
+        unique_ids = []
         media_group_id = 0
         entities = extract_entities(message)
 
@@ -1135,7 +1142,8 @@ async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, album
     selected = data.get('selected_suboptions', {})
     check_photo = data.get('check_photo')
 
-    pending_orders[order_id] = {
+    await orders_repo.create_order(order_id, {
+        'order_type': 'publication',
         'user_id': message.from_user.id,
         'user_username': message.from_user.username,
         'user_type': user_type,
@@ -1144,11 +1152,12 @@ async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, album
         'content_type': content_type,
         'text': text,
         'file_ids': file_ids,
+        'file_unique_ids': unique_ids,
         'media_group_id': media_group_id,
         'entities': entities,
         'check_photo': check_photo,
         'total': total,
-    }
+    })
 
     builder = InlineKeyboardBuilder()
     builder.button(text="Подтвердить", callback_data=AdminCallback(action="confirm", order_id=order_id).pack())
@@ -1168,15 +1177,15 @@ async def purchase_get_post(message: Message, state: FSMContext, bot: Bot, album
         media = [InputMediaPhoto(media=fid, caption=text if i == 0 else None) for i, fid in enumerate(file_ids)]
         if text and entities:
             media[0].caption_entities = entities or None
-        await bot.send_media_group(ADMIN_CHAT_ID, media)
+        await bot.send_media_group(settings.admin_chat_id, media)
     else:
-        await bot.send_message(ADMIN_CHAT_ID, text or '(без текста)', entities=entities or None)
+        await bot.send_message(settings.admin_chat_id, text or '(без текста)', entities=entities or None)
 
     # Отправляем чек с кнопками подтверждения/отклонения
     if check_photo:
-        await bot.send_photo(ADMIN_CHAT_ID, photo=check_photo, caption=caption, reply_markup=builder.as_markup())
+        await bot.send_photo(settings.admin_chat_id, photo=check_photo, caption=caption, reply_markup=builder.as_markup())
     else:
-        await bot.send_message(ADMIN_CHAT_ID, caption, reply_markup=builder.as_markup())
+        await bot.send_message(settings.admin_chat_id, caption, reply_markup=builder.as_markup())
 
     await message.answer("Ваш заказ отправлен на модерацию!")
     await state.clear()
@@ -1213,6 +1222,7 @@ async def broadcast_waiting_post(message: Message, state: FSMContext, album: Lis
     if album:
         content_type = 'photo'
         file_ids = [msg.photo[-1].file_id for msg in album if msg.photo]
+        unique_ids = [msg.photo[-1].file_unique_id for msg in album if msg.photo]
         cap_msg = next((msg for msg in album if msg.caption), None)
         text = cap_msg.caption if cap_msg else ''
         media_group_id = album[0].media_group_id if album and album[0].media_group_id else 0
@@ -1223,11 +1233,13 @@ async def broadcast_waiting_post(message: Message, state: FSMContext, album: Lis
             content_type = 'text'
             text = message.text
             file_ids = []
+            unique_ids = []
             entities = extract_entities(message)
         elif message.photo:
             content_type = 'photo'
             text = message.caption or ''
             file_ids = [message.photo[-1].file_id]
+            unique_ids = [message.photo[-1].file_unique_id]
             entities = extract_entities(message)
         else:
             await message.answer("Пожалуйста, отправьте текст или фото.")
@@ -1244,6 +1256,7 @@ async def broadcast_waiting_post(message: Message, state: FSMContext, album: Lis
         broadcast_content_type=content_type,
         broadcast_text=text,
         broadcast_file_ids=file_ids,
+        broadcast_unique_ids=unique_ids,
         broadcast_media_group_id=media_group_id,
         broadcast_entities=entities
     )
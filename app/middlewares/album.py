@@ -1,11 +1,90 @@
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Bot
 from aiogram.types import Message
 from typing import Callable, Dict, Any, Awaitable
 import asyncio
+import logging
+import time
+
+from app.database.album_buffer import DBAlbumBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class _Album:
+    __slots__ = ('messages', 'updated', 'started')
+
+    def __init__(self, first: Message):
+        self.messages = [first]
+        self.updated = asyncio.Event()
+        self.started = time.monotonic()
+
+
+class MemoryAlbumBuffer:
+    """Сборка альбомов в памяти процесса (по умолчанию, один воркер).
+
+    Все обращения к _albums идут из одного event loop, и между проверкой ключа и вставкой
+    нет await — гонки «две части одновременно стали первыми» здесь быть не может, блокировка не нужна.
+    """
+
+    def __init__(self, quiet: float, max_wait: float, max_parts: int, max_groups: int):
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.max_parts = max_parts
+        self.max_groups = max_groups
+        self._albums: dict[tuple[int, str], _Album] = {}
+
+    async def add(self, key: tuple[int, str], message: Message, bot: Bot) -> list[Message] | None:
+        album = self._albums.get(key)
+        if album is not None:
+            album.messages.append(message)
+            album.updated.set()
+            return None  # альбом отдаст хендлеру тот, кто получил первую часть
+
+        self._drop_orphans()
+        if len(self._albums) >= self.max_groups:
+            logger.warning(f"Album buffer is full ({self.max_groups}), passing part of {key} as is")
+            return [message]
+
+        album = self._albums[key] = _Album(message)
+        try:
+            await self._collect(album)
+        finally:
+            self._albums.pop(key, None)
+        return album.messages
+
+    async def _collect(self, album: _Album):
+        while len(album.messages) < self.max_parts:
+            left = self.max_wait - (time.monotonic() - album.started)
+            if left <= 0:
+                break
+            album.updated.clear()
+            try:
+                await asyncio.wait_for(album.updated.wait(), timeout=min(self.quiet, left))
+            except asyncio.TimeoutError:
+                break  # новых частей не было quiet секунд — альбом собран
+
+    def _drop_orphans(self):
+        # Альбом, чей сборщик не снял его за 2 * max_wait, уже никто не отдаст хендлеру
+        deadline = time.monotonic() - 2 * self.max_wait
+        for key in [k for k, a in self._albums.items() if a.started < deadline]:
+            del self._albums[key]
 
 
 class AlbumMiddleware(BaseMiddleware):
-    album_data: dict = {}
+    """Собирает части альбома (media_group) и вызывает хендлер один раз со всем альбомом в data["album"].
+
+    Хендлер вызывается, как только после последней части прошло quiet секунд, набралось
+    max_parts частей (больше 10 Telegram не присылает) или с первой части прошло max_wait секунд.
+    Альбомы различаются по (chat_id, media_group_id). backend='db' — общий буфер в БД для
+    нескольких воркеров, иначе буфер в памяти (не больше max_groups альбомов одновременно).
+    """
+
+    def __init__(self, quiet: float = 0.5, max_wait: float = 3.0, max_parts: int = 10, max_groups: int = 1000,
+                 backend: str = 'memory'):
+        if backend == 'db':
+            self.buffer = DBAlbumBuffer(quiet, max_wait, max_parts)
+        else:
+            self.buffer = MemoryAlbumBuffer(quiet, max_wait, max_parts, max_groups)
 
     async def __call__(
         self,
@@ -16,13 +95,8 @@ class AlbumMiddleware(BaseMiddleware):
         if not event.media_group_id:
             return await handler(event, data)
 
-        try:
-            self.album_data[event.media_group_id].append(event)
+        album = await self.buffer.add((event.chat.id, event.media_group_id), event, data['bot'])
+        if album is None:
             return  # Не вызываем хендлер для отдельных сообщений в группе
-        except KeyError:
-            self.album_data[event.media_group_id] = [event]
-            await asyncio.sleep(0.01)  # Маленькая задержка для сбора всей группы
-
-        await asyncio.sleep(2)  # Ждём 2 секунды на сбор всей группы
-        data["album"] = self.album_data.pop(event.media_group_id)
-        return await handler(event, data)
\ No newline at end of file
+        data["album"] = sorted(album, key=lambda m: m.message_id)
+        return await handler(event, data)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, SendMediaGroup
+from aiogram.methods.base import Response, TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API
+GLOBAL_RATE = 30.0          # сообщений в секунду на бота
+GROUP_RATE = 20.0 / 60.0    # сообщений в секунду в одну группу/канал
+PRIVATE_RATE = 1.0          # сообщений в секунду в один личный чат
+MAX_RETRIES = 5
+SWEEP_INTERVAL = 60.0       # секунд между чистками простаивающих корзин чатов
+
+
+class TokenBucket:
+    """Корзина токенов с резервированием: reserve() сразу списывает токены и
+    возвращает, сколько нужно подождать. Порядок ожидающих сохраняется без блокировок."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self, now: float) -> bool:
+        # Полная корзина ничем не отличается от новой — её можно выбросить
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def block(self, seconds: float):
+        # После 429 чат недоступен retry_after секунд — сдвигаем всю очередь
+        self.reserve(0)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class FloodControlMiddleware(BaseRequestMiddleware):
+    """Единый шлюз отправки: все вызовы Bot проходят через корзины токенов
+    (глобальную и по чату) и повторяются после TelegramRetryAfter, а не теряются."""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, group_rate: float = GROUP_RATE,
+                 private_rate: float = PRIVATE_RATE, max_retries: int = MAX_RETRIES,
+                 sweep_interval: float = SWEEP_INTERVAL):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self.sweep_interval = sweep_interval
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self._swept_at = time.monotonic()
+        # Метрики
+        self.waiting = 0
+        self.waiting_by_chat: dict[int | str, int] = {}
+        self.sent = 0
+        self.retry_after_hits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _sweep(self, now: float):
+        """Убирает корзины чатов, которые успели наполниться и никого не ждут.
+
+        Иначе словарь рос бы на каждый чат, которому бот хоть раз ответил.
+        """
+        self._swept_at = now
+        idle = [chat_id for chat_id, bucket in self.chat_buckets.items()
+                if chat_id not in self.waiting_by_chat and bucket.is_full(now)]
+        for chat_id in idle:
+            del self.chat_buckets[chat_id]
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            now = time.monotonic()
+            if now - self._swept_at >= self.sweep_interval:
+                self._sweep(now)
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.private_rate if is_private else self.group_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, 1.0 if is_private else 3.0)
+        return bucket
+
+    @staticmethod
+    def _is_send(method: TelegramMethod) -> bool:
+        name = type(method).__name__
+        return name.startswith(('Send', 'Forward', 'Copy'))
+
+    async def _wait(self, chat_id: int | str | None, weight: int):
+        # Глобальный токен берём только после очереди чата: запрос, который секундами ждёт
+        # заблокированный после 429 чат, не должен занимать глобальную ёмкость, нужную другим чатам
+        waited = 0.0
+        if chat_id is not None:
+            waited += await self._sleep(chat_id, self._chat_bucket(chat_id).reserve(weight))
+        waited += await self._sleep(chat_id, self.global_bucket.reserve(weight))
+        if waited:
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    async def _sleep(self, chat_id: int | str | None, delay: float) -> float:
+        if delay <= 0:
+            return 0.0
+        self.waiting += 1
+        if chat_id is not None:
+            self.waiting_by_chat[chat_id] = self.waiting_by_chat.get(chat_id, 0) + 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+            if chat_id is not None:
+                left = self.waiting_by_chat.get(chat_id, 1) - 1
+                if left:
+                    self.waiting_by_chat[chat_id] = left
+                else:
+                    self.waiting_by_chat.pop(chat_id, None)
+        return delay
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None) if self._is_send(method) else None
+        weight = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._wait(chat_id, weight)
+            try:
+                response = await make_request(bot, method)
+                if chat_id is not None:
+                    self.sent += weight
+                return response
+            except TelegramRetryAfter as e:
+                self.retry_after_hits += 1
+                attempt += 1
+                if chat_id is not None:
+                    # Чат закрыт на retry_after для всей очереди — даже если этот запрос сдаётся
+                    self._chat_bucket(chat_id).block(e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"Flood control: {type(method).__name__} to {chat_id}, retry after {e.retry_after}s "
+                               f"(attempt {attempt}/{self.max_retries})")
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'queue_depth': self.waiting,
+            'queue_depth_by_chat': dict(self.waiting_by_chat),
+            'sent': self.sent,
+            'retry_after_hits': self.retry_after_hits,
+            'avg_wait': self.total_wait / self.sent if self.sent else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+flood_control = FloodControlMiddleware()
@@ -0,0 +1,42 @@
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+from typing import Callable, Dict, Any, Awaitable
+
+from app.database.unit_of_work import unit_of_work, commit
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """Весь хендлер работает с БД в одной сессии: commit в конце, откат при исключении.
+
+    Перед ответами бота транзакция фиксируется раньше — см. CommitBeforeRequestMiddleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with unit_of_work():
+            return await handler(event, data)
+
+
+class CommitBeforeRequestMiddleware(BaseRequestMiddleware):
+    """Фиксирует открытый unit_of_work перед каждым запросом к Telegram.
+
+    Иначе транзакция записи SQLite держалась бы всё время отправки, включая ожидание
+    flood control и повторы после 429, и остальные писатели упирались бы в busy_timeout.
+    Регистрируется до flood_control, чтобы commit случался до ожидания, а не после.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        await commit()
+        return await make_request(bot, method)
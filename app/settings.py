@@ -0,0 +1,57 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import dotenv
+
+dotenv.load_dotenv()
+
+
+def _chat_id(env, name: str, default: int | None = None) -> int:
+    raw = (env.get(name) or '').strip()
+    if not raw:
+        if default is None:
+            raise ValueError(f"{name} is not set")
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer chat id, got {raw!r}") from None
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Настройки развёртывания: читаются из окружения один раз при старте (get_settings).
+
+    Id чатов уже приведены к int, часовой пояс — общий объект ZoneInfo. В хендлеры
+    передаются через workflow data диспетчера: dp["settings"].
+    """
+    main_chat_id: int
+    channel_id: int        # премиум-канал
+    admin_chat_id: int
+    notification_chat: int  # NOTIFICATION_CHAT, по умолчанию — ADMIN_CHAT_ID
+    free_chat_id: int
+    tz: ZoneInfo
+
+    @classmethod
+    def from_env(cls, env=os.environ) -> 'Settings':
+        admin_chat_id = _chat_id(env, 'ADMIN_CHAT_ID')
+        tz_name = env.get('TIMEZONE') or 'Europe/Moscow'
+        try:
+            tz = ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"TIMEZONE: unknown time zone {tz_name!r}") from None
+        return cls(
+            main_chat_id=_chat_id(env, 'MAIN_CHAT_ID'),
+            channel_id=_chat_id(env, 'CHANNEL_ID', 0),
+            admin_chat_id=admin_chat_id,
+            notification_chat=_chat_id(env, 'NOTIFICATION_CHAT', admin_chat_id),
+            free_chat_id=_chat_id(env, 'FREE_CHAT_ID', 0),
+            tz=tz,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    return Settings.from_env()
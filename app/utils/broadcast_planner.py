@@ -0,0 +1,200 @@
+# utils/broadcast_planner.py
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from apscheduler.triggers.date import DateTrigger
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько будущих слотов держать посчитанными для каждой кампании
+SLOTS_AHEAD = int(os.getenv('BROADCAST_SLOTS_AHEAD', '16'))
+BROADCAST_JOB = 'broadcast_task'
+
+
+def in_window(dt: datetime, mode: str, start_min: int, end_min: int) -> bool:
+    if mode != 'limited':
+        return True
+    mins = dt.hour * 60 + dt.minute
+    if start_min <= end_min:
+        return start_min <= mins < end_min
+    # окно через полночь
+    return mins >= start_min or mins < end_min
+
+
+def next_window_start(ref: datetime, mode: str, start_min: int, end_min: int) -> datetime:
+    """ref, если он внутри окна, иначе ближайшее будущее начало окна."""
+    if in_window(ref, mode, start_min, end_min):
+        return ref
+    start_today = ref.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=start_min)
+    # Вне окна через полночь ref лежит между end и start того же дня — start сегодня ещё впереди
+    return start_today if ref < start_today else start_today + timedelta(days=1)
+
+
+def _own_window(bp) -> tuple[str, int, int]:
+    return getattr(bp, 'mode', 'full') or 'full', getattr(bp, 'active_start_min', 9 * 60), getattr(bp, 'active_end_min', 23 * 60)
+
+
+def _effective_window(window: tuple[str, int, int], cfg) -> tuple[str, int, int]:
+    mode, start_min, end_min = window
+    if mode == 'limited' and cfg is not None and not cfg.enabled:
+        mode = 'full'
+    return mode, start_min, end_min
+
+
+def broadcast_window(bp, cfg) -> tuple[str, int, int]:
+    """Режим и окно кампании; при выключенной глобальной конфигурации limited работает как full."""
+    return _effective_window(_own_window(bp), cfg)
+
+
+def plan_slots(first: datetime, interval: timedelta, window: tuple[str, int, int], end_time: datetime,
+               count: int, after: datetime | None = None) -> list[datetime]:
+    """count ближайших моментов публикации начиная с first (позже after), не позже end_time.
+
+    Каждый слот считается от предыдущего слота, а не от фактического времени отправки,
+    поэтому задержки публикаций не накапливаются. В limited слот за окном переносится
+    на начало следующего окна — каждый день сетка начинается заново с начала окна.
+    """
+    slots = []
+    slot = next_window_start(first, *window)
+    while len(slots) < count and slot <= end_time:
+        if after is None or slot > after:
+            slots.append(slot)
+        slot = next_window_start(slot + interval, *window)
+    return slots
+
+
+class _Campaign:
+    __slots__ = ('interval', 'own_window', 'window', 'end_time', 'slots')
+
+    def __init__(self, interval: timedelta, own_window: tuple[str, int, int], end_time: datetime, cfg):
+        self.interval = interval
+        self.own_window = own_window
+        self.window = _effective_window(own_window, cfg)
+        self.end_time = end_time
+        self.slots: deque[datetime] = deque()
+
+
+class BroadcastPlanner:
+    """Календарь слотов broadcast-кампаний.
+
+    Для каждой активной кампании держит SLOTS_AHEAD ближайших моментов публикации и
+    ставит в APScheduler один DateTrigger на самый ранний из них — broadcast_task
+    срабатывает точно в слот, а не ежеминутным опросом. Слоты пересчитываются только
+    при изменении кампании (plan/forget) или глобального окна (set_config).
+    """
+
+    def __init__(self):
+        self._campaigns: dict[int, _Campaign] = {}
+        self._cfg = None
+        self._scheduler = None
+        self._callback: Callable[[], Awaitable[None]] | None = None
+
+    @staticmethod
+    def _aware(dt: datetime | None) -> datetime | None:
+        if dt is None:
+            return None
+        tz = get_settings().tz
+        return dt.replace(tzinfo=tz) if dt.tzinfo is None else dt.astimezone(tz)
+
+    def __len__(self):
+        return len(self._campaigns)
+
+    def start(self, scheduler, callback: Callable[[], Awaitable[None]]):
+        self._scheduler = scheduler
+        self._callback = callback
+        self.arm()
+
+    def seed(self, posts, cfg):
+        self._cfg = cfg
+        for bp in posts:
+            self._plan(bp)
+        logger.info(f"Broadcast planner seeded: {len(self._campaigns)} campaigns")
+        self.arm()
+
+    def _plan(self, bp):
+        self._campaigns.pop(bp.id, None)
+        first, end_time = self._aware(bp.next_run_time), self._aware(bp.end_time)
+        if not bp.is_active or not first or not end_time:
+            return
+        campaign = _Campaign(timedelta(minutes=bp.interval_minutes), _own_window(bp), end_time, self._cfg)
+        campaign.slots.extend(plan_slots(first, campaign.interval, campaign.window, end_time, SLOTS_AHEAD))
+        self._campaigns[bp.id] = campaign
+
+    def plan(self, bp):
+        """Кампания создана или изменена — пересчитать её слоты от next_run_time."""
+        self._plan(bp)
+        self.arm()
+
+    def forget(self, post_id: int):
+        if self._campaigns.pop(post_id, None) is not None:
+            self.arm()
+
+    def set_config(self, cfg):
+        """Изменилось глобальное окно: пересчитываем кампании, оставляя ближайший слот точкой отсчёта."""
+        self._cfg = cfg
+        for campaign in self._campaigns.values():
+            campaign.window = _effective_window(campaign.own_window, cfg)
+            if campaign.slots:
+                first = campaign.slots[0]
+                campaign.slots.clear()
+                campaign.slots.extend(plan_slots(first, campaign.interval, campaign.window,
+                                                 campaign.end_time, SLOTS_AHEAD))
+        self.arm()
+
+    def window(self, bp) -> tuple[str, int, int]:
+        return broadcast_window(bp, self._cfg)
+
+    def next_slot(self, bp, now: datetime) -> datetime | None:
+        """Первый слот кампании позже now (None — до end_time слотов больше нет).
+
+        Прошедшие слоты отбрасываются без «догоняющих» публикаций; когда запас
+        заканчивается, следующие SLOTS_AHEAD слотов досчитываются от последнего.
+        """
+        campaign = self._campaigns.get(bp.id)
+        if campaign is None:
+            self._plan(bp)
+            campaign = self._campaigns.get(bp.id)
+            if campaign is None:
+                return None
+        if not self._advance(campaign, now):
+            del self._campaigns[bp.id]
+            return None
+        return campaign.slots[0]
+
+    def skip_past(self, now: datetime):
+        """Отбросить прошедшие слоты у всех кампаний — в том числе у тех, что не попали в выборку тика
+        (остановлены или перенесены в обход планировщика), иначе таймер срабатывал бы на них снова и снова."""
+        for post_id in [pid for pid, c in self._campaigns.items() if not self._advance(c, now)]:
+            del self._campaigns[post_id]
+
+    @staticmethod
+    def _advance(campaign: _Campaign, now: datetime) -> bool:
+        slots = campaign.slots
+        while slots and slots[0] <= now:
+            last = slots.popleft()
+            if not slots:
+                slots.extend(plan_slots(last + campaign.interval, campaign.interval, campaign.window,
+                                        campaign.end_time, SLOTS_AHEAD, after=now))
+        return bool(slots)
+
+    def arm(self):
+        """Поставить таймер broadcast_task на ближайший слот среди всех кампаний."""
+        if self._scheduler is None:
+            return
+        heads = [c.slots[0] for c in self._campaigns.values() if c.slots]
+        if not heads:
+            if self._scheduler.get_job(BROADCAST_JOB):
+                self._scheduler.remove_job(BROADCAST_JOB)
+            return
+        # Прошедший слот (после простоя) — срабатываем сразу, иначе APScheduler счёл бы его пропущенным
+        run_at = max(min(heads), datetime.now(get_settings().tz))
+        self._scheduler.add_job(self._callback, trigger=DateTrigger(run_date=run_at), id=BROADCAST_JOB,
+                                replace_existing=True, misfire_grace_time=None)
+
+
+broadcast_planner = BroadcastPlanner()
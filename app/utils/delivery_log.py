@@ -0,0 +1,75 @@
+# utils/delivery_log.py
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryLog:
+    """Буфер журнала отправок рассылок.
+
+    Публикации только добавляют запись в память (add), в БД записи уходят пачкой —
+    раз в flush_interval секунд или сразу, как набралось batch_size. Если запись
+    не удалась, пачка возвращается в буфер (не больше max_buffered записей).
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0, max_buffered: int = 10_000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._rows: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._writer: Callable[[list[dict]], Awaitable[None]] | None = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row: dict):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self, writer: Callable[[list[dict]], Awaitable[None]]):
+        self._writer = writer
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='delivery_log')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._rows or self._writer is None:
+            return
+        rows, self._rows = self._rows, []
+        try:
+            await self._writer(rows)
+        except Exception as e:
+            logger.exception(f"Delivery log flush failed ({len(rows)} rows): {e}")
+            self._rows[:0] = rows
+            if len(self._rows) > self.max_buffered:
+                dropped = len(self._rows) - self.max_buffered
+                del self._rows[:dropped]
+                logger.warning(f"Delivery log buffer is full, dropped {dropped} oldest rows")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+delivery_log = DeliveryLog(batch_size=int(os.getenv('DELIVERY_LOG_BATCH', '100')),
+                           flush_interval=float(os.getenv('DELIVERY_LOG_FLUSH_INTERVAL', '5')))
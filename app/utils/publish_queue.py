@@ -0,0 +1,123 @@
+# utils/publish_queue.py
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueue:
+    """Очередь публикаций, упорядоченная по scheduled_time.
+
+    Заполняется один раз из БД при старте (seed), дальше поддерживается
+    add_or_update_scheduled_post / delete_scheduled_post. Каждый пост
+    срабатывает в своё scheduled_time — без ежеминутного сканирования таблицы.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int]] = []
+        self._due: dict[int, datetime] = {}  # post_id -> актуальное время публикации
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._callback: Callable[[int], Awaitable[None]] | None = None
+
+    @staticmethod
+    def _aware(dt: datetime) -> datetime:
+        tz = get_settings().tz
+        return dt.replace(tzinfo=tz) if dt.tzinfo is None else dt.astimezone(tz)
+
+    def __len__(self):
+        return len(self._due)
+
+    def _push(self, post_id: int, run_at: datetime | None) -> bool:
+        if run_at is None:
+            self.discard(post_id)
+            return False
+        run_at = self._aware(run_at)
+        if self._due.get(post_id) == run_at:
+            return False
+        self._due[post_id] = run_at
+        heapq.heappush(self._heap, (run_at, post_id))
+        return True
+
+    def _compact(self):
+        # Если куча разрослась из-за переносов — пересобираем её
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(t, pid) for pid, t in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def schedule(self, post_id: int, run_at: datetime | None):
+        """Добавить/перенести публикацию поста. Старые записи в куче считаются устаревшими."""
+        if self._push(post_id, run_at):
+            self._compact()
+            self._wakeup.set()
+
+    def schedule_many(self, items):
+        """Пакетный вариант schedule: items — пары (post_id, run_at), таймер будится один раз."""
+        changed = False
+        for post_id, run_at in items:
+            changed |= self._push(post_id, run_at)
+        if changed:
+            self._compact()
+            self._wakeup.set()
+
+    def discard(self, post_id: int):
+        # Запись в куче остаётся, но будет пропущена как устаревшая
+        self._due.pop(post_id, None)
+
+    def seed(self, posts):
+        self.schedule_many((post.id, post.scheduled_time) for post in posts
+                           if not post.is_published and post.scheduled_time)
+        logger.info(f"Publish queue seeded: {len(self._due)} posts")
+
+    def start(self, callback: Callable[[int], Awaitable[None]]):
+        self._callback = callback
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='publish_queue')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _peek(self) -> tuple[datetime, int] | None:
+        while self._heap:
+            run_at, post_id = self._heap[0]
+            if self._due.get(post_id) == run_at:
+                return run_at, post_id
+            heapq.heappop(self._heap)  # устаревшая запись
+        return None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            head = self._peek()
+            if head is None:
+                await self._wakeup.wait()
+                continue
+            run_at, post_id = head
+            delay = (run_at - datetime.now(get_settings().tz)).total_seconds()
+            if delay > 0:
+                try:
+                    # Просыпаемся раньше, если в очередь добавили более ранний пост
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            del self._due[post_id]
+            try:
+                await self._callback(post_id)
+            except Exception as e:
+                logger.exception(f"Publish queue callback failed for post {post_id}: {e}")
+
+
+publish_queue = PublishQueue()
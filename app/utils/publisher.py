@@ -0,0 +1,68 @@
+# utils/publisher.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Воркер чата завершается после стольких секунд простоя
+IDLE_TIMEOUT = 60.0
+
+
+class ChatPublisher:
+    """Конвейер публикаций: своя очередь и свой воркер на каждый целевой чат.
+
+    Разные чаты публикуются параллельно, внутри одного чата сохраняется порядок
+    постановки в очередь. Лимиты Telegram выдерживает FloodControlMiddleware.
+    """
+
+    def __init__(self):
+        self._queues: dict[int, asyncio.Queue] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+
+    def submit(self, chat_id: int | str, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Поставить публикацию в очередь чата."""
+        chat_id = int(chat_id)
+        fut = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        queue.put_nowait((job, fut))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue), name=f'publisher_{chat_id}')
+        return fut
+
+    def queue_sizes(self) -> dict[int, int]:
+        return {chat_id: q.qsize() for chat_id, q in self._queues.items()}
+
+    async def _worker(self, chat_id: int, queue: asyncio.Queue):
+        while True:
+            try:
+                job, fut = await asyncio.wait_for(queue.get(), timeout=IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self._queues.pop(chat_id, None)
+                    self._workers.pop(chat_id, None)
+                    return
+                continue
+            try:
+                result = await job()
+                if not fut.done():
+                    fut.set_result(result)
+            except Exception as e:
+                logger.exception(f"Publish job failed in chat {chat_id}: {e}")
+                if not fut.done():
+                    fut.set_result(None)
+            finally:
+                queue.task_done()
+
+    async def stop(self):
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+
+publisher = ChatPublisher()
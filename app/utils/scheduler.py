@@ -4,59 +4,136 @@ import asyncio
 import os
 from datetime import datetime, timedelta
 import random
+import time
+from dataclasses import dataclass
+from functools import partial
 from aiogram import Bot
 from aiogram.types import InputMediaPhoto
 from aiogram.exceptions import TelegramBadRequest  # NEW
-from app.database.requests import get_pending_posts, delete_pending_post, get_scheduled_posts, delete_scheduled_post
+from app.database.requests import delete_pending_post, delete_scheduled_post
 import app.database.requests as req
-import pytz
+from app.database.unit_of_work import unit_of_work, after_commit
+from app.settings import get_settings
 from app.database.models import ScheduledPost, PendingPost
+from app.utils.publish_queue import publish_queue
+from app.utils.publisher import publisher
+from app.utils.broadcast_planner import broadcast_planner, in_window
+from app.utils.delivery_log import delivery_log
 from apscheduler.triggers.date import DateTrigger
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Хранилище APScheduler для job'ов постов (открепление/удаление/уведомления) — переживает рестарт
+POST_JOBSTORE = 'persistent'
 
-async def handle_missed_tasks(bot: Bot, channel_id: int | str, scheduler):
-    msk_tz = pytz.timezone("Europe/Moscow")
-    now = datetime.now(msk_tz)
-    scheduled_posts = await get_scheduled_posts()  # Ваша функция для получения постов
-    for post in scheduled_posts:
-        if not post.is_published:
-            continue
-        # Безопасная локализация (используйте вашу функцию make_aware)
-        unpin_time = make_aware(post.unpin_time, msk_tz) if post.unpin_time else None
-        delete_time = make_aware(post.delete_time, msk_tz) if post.delete_time else None
-        msg = post.message_ids
-        is_pinned = await req.get_pin_info(post.message_ids[0]) if post.message_ids else False
-        target_chat = post.chat_id or channel_id
+_bot: Bot | None = None
+
+
+def set_bot(bot: Bot):
+    global _bot
+    _bot = bot
+
+
+@dataclass(frozen=True, slots=True)
+class PostSnapshot:
+    """То, что job'у нужно знать о посте до срабатывания: id, куда опубликован и его времена.
+
+    Содержимое (текст, entities, файлы) job перечитывает из БД в момент запуска.
+    """
+    id: int
+    chat_id: int | str
+    message_ids: tuple[int, ...]
+    unpin_time: datetime | None
+    delete_time: datetime | None
+
+    @classmethod
+    def of(cls, post: ScheduledPost, channel_id: int | str) -> 'PostSnapshot':
+        return cls(post.id, post.chat_id or channel_id, tuple(post.message_ids or ()), post.unpin_time, post.delete_time)
+
+
+RECOVERY_CONCURRENCY = int(os.getenv('RECOVERY_CONCURRENCY', '5'))
+
+
+async def _recover_post(bot: Bot, channel_id: int | str, post: ScheduledPost, is_pinned: bool,
+                        now: datetime, sem: asyncio.Semaphore) -> int | None:
+    """Пропущенные открепление/удаление одного поста. Возвращает id поста, если он удалён."""
+    msk_tz = get_settings().tz
+    unpin_time = make_aware(post.unpin_time, msk_tz) if post.unpin_time else None
+    delete_time = make_aware(post.delete_time, msk_tz) if post.delete_time else None
+    msg = post.message_ids
+    target_chat = post.chat_id or channel_id
+    async with sem:
         # Проверка и выполнение missed unpin
-        if unpin_time and now >= unpin_time and is_pinned:  # Предполагаем поле is_unpinned в модели
+        if unpin_time and now >= unpin_time and is_pinned:
             try:
                 await unpin_after_duration(bot, target_chat, msg[0])  # Выполняем открепление
-                #await notification_admins(bot, os.getenv('NOTIFICATION_CHAT'), post, 'unpin')  # Уведомление
+                #await notification_admins(bot, get_settings().notification_chat, post, 'unpin')  # Уведомление
                 logger.info(f"Performed missed unpin for post {post.id}")
             except Exception as e:
                 logger.error(f"Error performing missed unpin for post {post.id}: {e}")
         # Проверка и выполнение missed delete
-        if delete_time and now >= delete_time:  # Предполагаем поле is_deleted
+        if delete_time and now >= delete_time:
             try:
                 await bot.delete_messages(target_chat, msg)  # Удаление сообщений
                 await delete_scheduled_post(post.id)  # Удаление из БД
-                await notification_admins(bot, os.getenv('NOTIFICATION_CHAT'), post, 'delete')  # Уведомление
+                await notification_admins(bot, get_settings().notification_chat, post, 'delete')  # Уведомление
                 logger.info(f"Performed missed delete for post {post.id}")
+                return post.id
             except Exception as e:
                 logger.error(f"Error performing missed delete for post {post.id}: {e}")
-        # Если время не прошло, добавляем в scheduler как обычно
-        if (unpin_time and now < unpin_time) or (delete_time and now < delete_time):
-            await update_unpin_or_delete_task(bot, channel_id, scheduler)  # Ваша функция для добавления jobs
+    return None
+
+
+async def handle_missed_tasks(bot: Bot, channel_id: int | str, scheduler):
+    """Восстановление после рестарта: выполняет пропущенные открепления/удаления
+    и сверяет job'ы в постоянном хранилище с БД — дописывает недостающие, удаляет осиротевшие.
+
+    Запускается фоновой задачей после scheduler.start() (до старта get_jobs не видит сохранённые job'ы):
+    бот уже принимает апдейты, а пропущенные действия идут не более RECOVERY_CONCURRENCY одновременно.
+    """
+    msk_tz = get_settings().tz
+    timings = {}
+    started = phase = time.perf_counter()
+    now = datetime.now(msk_tz)
+    async with unit_of_work():
+        scheduled_posts = await req.get_published_scheduled_posts()
+        pinned = await req.get_pin_infos([p.message_ids[0] for p in scheduled_posts if p.message_ids])
+    timings['load'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    missed = [p for p in scheduled_posts
+              if (p.unpin_time and make_aware(p.unpin_time, msk_tz) <= now)
+              or (p.delete_time and make_aware(p.delete_time, msk_tz) <= now)]
+    deleted = set()
+    if missed:
+        # Каждое действие — в своей сессии: общая сессия unit_of_work не допускает параллельных запросов
+        sem = asyncio.Semaphore(RECOVERY_CONCURRENCY)
+        tasks = [_recover_post(bot, channel_id, p, bool(p.message_ids) and pinned.get(p.message_ids[0], False), now, sem)
+                 for p in missed]
+        step = max(1, len(tasks) // 10)
+        for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+            deleted.add(await fut)
+            if done % step == 0 or done == len(tasks):
+                logger.info(f"Recovery: {done}/{len(tasks)} missed posts processed")
+    timings['missed'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    async with unit_of_work():
+        alive = [p for p in scheduled_posts if p.id not in deleted]
+        added, removed = await _sync_post_jobs(bot, channel_id, scheduler, alive, pinned, prune=True)
+    timings['jobs'] = time.perf_counter() - phase
+
+    logger.info(f"Startup recovery: {len(scheduled_posts)} published posts, {len(missed)} missed, "
+                f"jobs +{added}/-{removed}; " + ', '.join(f'{k} {v:.2f}s' for k, v in timings.items())
+                + f', total {time.perf_counter() - started:.2f}s')
 
 
 def make_aware(dt: datetime, tz) -> datetime | None:
     if dt is None:
         return None
     if dt.tzinfo is None:
-        return tz.localize(dt)
+        return dt.replace(tzinfo=tz)
     else:
         return dt.astimezone(tz)
 
@@ -72,18 +149,18 @@ async def post_content(bot: Bot, chat_id: int, post, notification: bool = False)
             if len(text) > 4096:
                 logger.warning(f"Skip publish: text too long ({len(text)} > 4096). post_id={getattr(post, 'id', None)}")
                 # уведомление админам (если это не служебное уведомление)
-                notif_chat = os.getenv('NOTIFICATION_CHAT') or os.getenv('ADMIN_CHAT_ID')
+                notif_chat = get_settings().notification_chat
                 if notif_chat and not notification:
-                    await bot.send_message(int(notif_chat), f"Пост id={getattr(post, 'id', None)} не опубликован: превышен лимит 4096 символов.")
+                    await bot.send_message(notif_chat, f"Пост id={getattr(post, 'id', None)} не опубликован: превышен лимит 4096 символов.")
                 return
             msg = await bot.send_message(target_chat, text, entities=entities or None)
 
         elif post.content_type == 'photo' and post.photo_file_ids:
             if len(text) > 1024:
                 logger.warning(f"Skip publish: caption too long ({len(text)} > 1024). post_id={getattr(post, 'id', None)}")
-                notif_chat = os.getenv('NOTIFICATION_CHAT') or os.getenv('ADMIN_CHAT_ID')
+                notif_chat = get_settings().notification_chat
                 if notif_chat and not notification:
-                    await bot.send_message(int(notif_chat), f"Пост id={getattr(post, 'id', None)} не опубликован: превышен лимит 1024 символов для подписи.")
+                    await bot.send_message(notif_chat, f"Пост id={getattr(post, 'id', None)} не опубликован: превышен лимит 1024 символов для подписи.")
                 return
             if len(post.photo_file_ids) == 1:
                 msg = await bot.send_photo(target_chat, post.photo_file_ids[0], caption=text or None, caption_entities=entities or None)
@@ -99,9 +176,9 @@ async def post_content(bot: Bot, chat_id: int, post, notification: bool = False)
     except TelegramBadRequest as e:
         logger.error(f"TelegramBadRequest while posting content (post id={getattr(post, 'id', None)}): {e}")
         try:
-            notif_chat = os.getenv('NOTIFICATION_CHAT') or os.getenv('ADMIN_CHAT_ID')
+            notif_chat = get_settings().notification_chat
             if notif_chat and not notification:
-                await bot.send_message(int(notif_chat), f"Не удалось опубликовать пост id={getattr(post, 'id', None)}: {e}")
+                await bot.send_message(notif_chat, f"Не удалось опубликовать пост id={getattr(post, 'id', None)}: {e}")
         except Exception as e2:
             logger.error(f"Failed to notify about bad request: {e2}")
         return
@@ -111,7 +188,7 @@ async def post_content(bot: Bot, chat_id: int, post, notification: bool = False)
 
     if not notification:
         m = [msg] if type(msg) is not list else msg
-        if getattr(post, 'chat_id', None) == int(os.getenv('MAIN_CHAT_ID')):
+        if getattr(post, 'chat_id', None) == get_settings().main_chat_id:
             await req.add_last_message_time(datetime.now())
         if isinstance(post, ScheduledPost):
             await req.add_or_update_scheduled_post(
@@ -132,24 +209,25 @@ async def unpin_after_duration(bot: Bot, chat_id: int, message_id: int):
 
 
 async def notification_admins(bot: Bot, chat_id: int | str, post: ScheduledPost, notification: str):
-    msk_tz = pytz.timezone("Europe/Moscow")
+    msk_tz = get_settings().tz
     now = datetime.now(msk_tz)
     text = f'id поста: {post.id}\n'
     dct = {}
-    if post.unpin_time:
-        post.unpin_time = make_aware(post.unpin_time, msk_tz)
-        if now >= post.unpin_time:
+    # Локальные копии: пост может быть привязан к сессии, менять его атрибуты нельзя
+    unpin_time = make_aware(post.unpin_time, msk_tz)
+    delete_time = make_aware(post.delete_time, msk_tz)
+    if unpin_time:
+        if now >= unpin_time:
             dct['unpin'] = f'Пост {post.id} был откреплён'
-        elif (post.unpin_time - now).days <= 3:
-            dct['unpin'] = (f'Пост будет откреплён через 3 дня или менее: {post.unpin_time}\n'
+        elif (unpin_time - now).days <= 3:
+            dct['unpin'] = (f'Пост будет откреплён через 3 дня или менее: {unpin_time}\n'
                             f'Изменить время открепления можно командой /pin_post, как её использовать указано в /help')
 
-    if post.delete_time:
-        post.delete_time = make_aware(post.delete_time, msk_tz)
-        if now >= post.delete_time:
+    if delete_time:
+        if now >= delete_time:
             dct['delete'] = f'Пост был удалён'
-        elif (post.delete_time - now).days <= 3:
-            dct['delete'] = (f'Пост будет удалён через 3 дня или менее: {post.delete_time}\n'
+        elif (delete_time - now).days <= 3:
+            dct['delete'] = (f'Пост будет удалён через 3 дня или менее: {delete_time}\n'
                              f'После удаления из чата он также будет удалён из базы данных')
 
     # Проверяем, есть ли соответствующее уведомление в словаре
@@ -159,254 +237,285 @@ async def notification_admins(bot: Bot, chat_id: int | str, post: ScheduledPost,
         await bot.send_message(chat_id, text=text)
 
 
-async def scheduler_task(bot: Bot, channel_id: int, scheduler):
-    msk_tz = pytz.timezone("Europe/Moscow")
-    now = datetime.now(msk_tz)
-
-    # Проверка запланированных постов
-    scheduled_posts = await get_scheduled_posts()
-    for post in scheduled_posts:
-        post.scheduled_time = make_aware(post.scheduled_time, msk_tz)
-        if post.scheduled_time > now or post.is_published:
-            continue
-        await post_content(bot, post.chat_id or channel_id, post)
-        await asyncio.sleep(5)
-        await update_unpin_or_delete_task(bot, channel_id, scheduler)
-
+async def publish_scheduled_post(bot: Bot, channel_id: int, scheduler, post_id: int):
+    """Колбэк очереди публикаций: срабатывает ровно в scheduled_time поста.
 
-async def update_unpin_or_delete_task(bot: Bot, channel_id: int | str, scheduler):
-    msk_tz = pytz.timezone("Europe/Moscow")
+    Сама публикация уходит в очередь целевого чата — разные чаты публикуются параллельно.
+    """
+    post = await req.get_scheduled_post(post_id)
+    if not post or post.is_published:
+        return
+    target_chat = post.chat_id or channel_id
+    publisher.submit(target_chat, partial(_publish_scheduled_post, bot, channel_id, scheduler, post_id))
+
+
+async def _publish_scheduled_post(bot: Bot, channel_id: int, scheduler, post_id: int):
+    # Перечитываем пост: пока он ждал в очереди чата, его могли удалить или изменить.
+    # Отметка о публикации фиксируется перед закреплением (CommitBeforeRequestMiddleware) —
+    # транзакция не держится во время запросов к Telegram
+    async with unit_of_work():
+        post = await req.get_scheduled_post(post_id)
+        if not post or post.is_published:
+            return
+        published = await post_content(bot, post.chat_id or channel_id, post)
+        if not published:
+            # Не удалось опубликовать — повторим через минуту, как раньше делал ежеминутный проход
+            publish_queue.schedule(post_id, datetime.now(get_settings().tz) + timedelta(minutes=1))
+            return
+        await update_unpin_or_delete_task(bot, channel_id, scheduler, [post_id])
+
+
+def _ensure_job(scheduler, func, run_date: datetime, args: list, job_id: str, existing: dict | None = None) -> bool:
+    """Регистрирует job, только если его ещё нет или изменились время запуска / аргументы.
+
+    existing — заранее прочитанные job'ы хранилища (id -> Job), чтобы не делать запрос на каждый id.
+    Возвращает True, если job записан.
+    """
+    job = existing.get(job_id) if existing is not None else scheduler.get_job(job_id, jobstore=POST_JOBSTORE)
+    if job is not None and job.next_run_time == run_date and list(job.args) == args:
+        return False
+    scheduler.add_job(func, trigger=DateTrigger(run_date=run_date), args=args, id=job_id,
+                      jobstore=POST_JOBSTORE, replace_existing=True)
+    return True
+
+
+def _post_jobs(post: ScheduledPost, channel_id: int | str, now: datetime):
+    """Job'ы, которые должны стоять для опубликованного поста: (func, run_date, args, job_id)."""
+    msk_tz = get_settings().tz
+    unpin_time = make_aware(post.unpin_time, msk_tz)
+    delete_time = make_aware(post.delete_time, msk_tz)
+    notify_chat = get_settings().notification_chat
+    snap = PostSnapshot.of(post, channel_id)
+    jobs = []
+    if unpin_time and now < unpin_time:
+        jobs += [
+            (notify_admins_job, unpin_time - timedelta(days=2, hours=23), [notify_chat, snap, 'unpin'], f'notify_unpin_3_{post.id}'),
+            (unpin_job, unpin_time, [snap.chat_id, snap.message_ids[0]], f'unpin_{post.id}'),
+            (notify_admins_job, unpin_time, [notify_chat, snap, 'unpin'], f'notify_unpin_{post.id}'),
+        ]
+    if delete_time and now < delete_time:
+        jobs += [
+            (notify_admins_job, delete_time - timedelta(days=2, hours=23), [notify_chat, snap, 'delete'], f'notify_3_delete_{post.id}'),
+            (delete_published_post, delete_time, [notify_chat, snap], f'delete_{post.id}'),
+        ]
+    # Предупреждение «за 3 дня», время которого уже прошло, не ставим: иначе каждая сверка
+    # добавляла бы его заново и оно срабатывало бы с устаревшим текстом
+    return [job for job in jobs if job[1] > now]
+
+
+async def _sync_post_jobs(bot: Bot, channel_id: int | str, scheduler, posts, pinned: dict[int, bool],
+                          prune: bool = False) -> tuple[int, int]:
+    """Закрепляет посты, которым это положено, и приводит их job'ы в хранилище к нужному виду.
+
+    prune=True — posts это все опубликованные посты, и job'ы остальных постов удаляются как осиротевшие.
+    Возвращает (записано, удалено).
+    """
+    msk_tz = get_settings().tz
     now = datetime.now(msk_tz)
-    # Проверка запланированных постов
-    scheduled_posts = await get_scheduled_posts()
-    for post in scheduled_posts:
-        if not post.is_published:
+    # Все job'ы хранилища (с распаковкой каждого) читаем только для полной сверки;
+    # для нескольких постов _ensure_job смотрит нужные id через get_job
+    existing = {job.id: job for job in scheduler.get_jobs(jobstore=POST_JOBSTORE)} if prune else None
+    wanted = set()
+    added = 0
+    for post in posts:
+        if not post.message_ids:
             continue
-        msg = post.message_ids
-        if not msg:
-            continue
-
-        unpin_time = make_aware(post.unpin_time, msk_tz) if post.unpin_time else None
-        delete_time = make_aware(post.delete_time, msk_tz) if post.delete_time else None
-
-        first_msg_id = msg[0]
-        is_pinned = await req.get_pin_info(first_msg_id)
-        target_chat = post.chat_id or channel_id
-        # 1) Пин разрешён ТОЛЬКО если время открепления ещё не наступило
-        if unpin_time and now < unpin_time and not is_pinned:
+        first_msg_id = post.message_ids[0]
+        unpin_time = make_aware(post.unpin_time, msk_tz)
+        # Пин разрешён ТОЛЬКО если время открепления ещё не наступило
+        if unpin_time and now < unpin_time and not pinned.get(first_msg_id, False):
             try:
-                await bot.pin_chat_message(target_chat, first_msg_id, disable_notification=True)
+                await bot.pin_chat_message(post.chat_id or channel_id, first_msg_id, disable_notification=True)
                 await req.set_pin_info(first_msg_id, True)  # фиксируем только после успеха
             except Exception as e:
                 logger.error(f"Не удалось закрепить сообщение {first_msg_id}: {e}")
-
-        if unpin_time and now < unpin_time:
+        for func, run_date, args, job_id in _post_jobs(post, channel_id, now):
+            wanted.add(job_id)
             try:
-                scheduler.add_job(
-                    notification_admins,
-                    trigger=DateTrigger(run_date=post.unpin_time-timedelta(days=2, hours=23)),
-                    args=[bot, os.getenv('NOTIFICATION_CHAT'), post, 'unpin'],
-                    id=f'notify_unpin_3_{post.id}',
-                    replace_existing=True
-                )
-                scheduler.add_job(
-                    unpin_after_duration,
-                    trigger=DateTrigger(run_date=post.unpin_time),
-                    args=[bot, target_chat, msg[0]],
-                    id=f'unpin_{post.id}',
-                    replace_existing=True
-                )
-                scheduler.add_job(
-                    notification_admins,
-                    trigger=DateTrigger(run_date=post.unpin_time),
-                    args=[bot, os.getenv('NOTIFICATION_CHAT'), post, 'unpin'],
-                    id=f'notify_unpin_{post.id}',
-                    replace_existing=True
-                )
+                added += _ensure_job(scheduler, func, run_date, args, job_id, existing)
             except Exception as e:
-                print(f"Не удалось закрепить сообщение: {e}")
-        if delete_time and now < delete_time:
-            try:
-                scheduler.add_job(
-                    notification_admins,
-                    trigger=DateTrigger(run_date=post.delete_time - timedelta(days=2, hours=23)),
-                    args=[bot, os.getenv('NOTIFICATION_CHAT'), post, 'delete'],
-                    id=f'notify_3_delete_{post.id}',
-                    replace_existing=True
-                )
-                scheduler.add_job(
-                    bot.delete_messages,
-                    trigger=DateTrigger(run_date=post.delete_time),
-                    args=[target_chat, msg],
-                    id=f'delete_{post.id}',
-                    replace_existing=True
-                )
-                scheduler.add_job(
-                    delete_scheduled_post,
-                    trigger=DateTrigger(run_date=post.delete_time),
-                    args=[post.id],
-                    id=f'delete_from_db_{post.id}',
-                    replace_existing=True
-                )
-                scheduler.add_job(
-                    notification_admins,
-                    trigger=DateTrigger(run_date=post.delete_time),
-                    args=[bot, os.getenv('NOTIFICATION_CHAT'), post, 'delete'],
-                    id=f'notify_delete_{post.id}',
-                    replace_existing=True
-                )
-            except Exception as e:
-                print(f'Не удалось запланировать удаление: {e}')
+                logger.error(f"Не удалось запланировать {job_id}: {e}")
+    removed = 0
+    if prune:
+        for job_id in existing.keys() - wanted:
+            scheduler.remove_job(job_id, jobstore=POST_JOBSTORE)
+            removed += 1
+    return added, removed
+
+
+async def update_unpin_or_delete_task(bot: Bot, channel_id: int | str, scheduler, post_ids: list[int] | None = None):
+    """Планирует закреп/открепление/удаление для опубликованных постов.
+
+    post_ids — только изменившиеся посты; None — все опубликованные, с удалением лишних job'ов.
+    Состояние закрепа берётся одним запросом на всю пачку.
+    """
+    async with unit_of_work():
+        if post_ids is None:
+            posts = await req.get_published_scheduled_posts()
+        else:
+            posts = [p for p in await req.get_scheduled_posts_by_ids(post_ids) if p.is_published]
+        pinned = await req.get_pin_infos([p.message_ids[0] for p in posts if p.message_ids])
+        await _sync_post_jobs(bot, channel_id, scheduler, posts, pinned, prune=post_ids is None)
+
 
+def _is_stale(post: ScheduledPost | None, snap: PostSnapshot, kind: str) -> bool:
+    # Пост удалён или его время поменяли после постановки job — сработает job с новым временем
+    if post is None:
+        return True
+    if kind == 'unpin':
+        return post.unpin_time != snap.unpin_time
+    return post.delete_time != snap.delete_time
+
+
+# Job'ы из POST_JOBSTORE сериализуются в БД, поэтому это функции уровня модуля без Bot в аргументах:
+# бот берётся из _bot, который main выставляет через set_bot при старте.
+
+async def notify_admins_job(chat_id: int | str, snap: PostSnapshot, notification: str):
+    async with unit_of_work():
+        post = await req.get_scheduled_post(snap.id)
+        if _is_stale(post, snap, notification):
+            return
+        await notification_admins(_bot, chat_id, post, notification)
+
+
+async def unpin_job(chat_id: int | str, message_id: int):
+    await unpin_after_duration(_bot, chat_id, message_id)
+
+
+async def delete_published_post(notify_chat: int | str, snap: PostSnapshot):
+    """Удаление по delete_time: сообщения из чата, уведомление админам, затем запись из БД."""
+    async with unit_of_work():
+        post = await req.get_scheduled_post(snap.id)
+        if _is_stale(post, snap, 'delete'):
+            return
+        try:
+            await _bot.delete_messages(snap.chat_id, list(post.message_ids or snap.message_ids))
+        except Exception as e:
+            logger.error(f"Не удалось удалить сообщения поста {snap.id}: {e}")
+        # Уведомление шлём до удаления записи — ему нужно содержимое поста
+        await notification_admins(_bot, notify_chat, post, 'delete')
+        await delete_scheduled_post(snap.id)
 
-async def pending_task(bot: Bot, channel_id: int):
-    msk_tz = pytz.timezone("Europe/Moscow")
+
+PENDING_PUBLISH_JOB = 'pending_publish'
+_pending_lock = asyncio.Lock()
+
+
+def _chat_is_quiet(last_message_time: datetime | None, now: datetime) -> bool:
+    # Низкая активность: днём (11–23 по Москве) и больше двух часов без публикаций в основном чате
+    if not 11 <= now.hour < 23:
+        return False
+    return last_message_time is None or (now - make_aware(last_message_time, get_settings().tz)) > timedelta(hours=2)
+
+
+async def pending_task(bot: Bot, channel_id: int, scheduler):
+    """Ежеминутная проверка низкой активности. Сама ничего не ждёт и не публикует:
+    при тишине в чате ставит разовый job публикации со случайной задержкой (если его ещё нет)."""
+    msk_tz = get_settings().tz
     now = datetime.now(msk_tz)
+    if _pending_lock.locked() or scheduler.get_job(PENDING_PUBLISH_JOB) is not None:
+        return  # публикация уже запланирована или идёт
+    if not _chat_is_quiet(await req.get_last_message_time(), now):
+        return
+    delay = random.randint(6, 36)  # Случайная задержка, чтобы публикации не шли ровно по минутам
+    scheduler.add_job(publish_pending_post, trigger=DateTrigger(run_date=now + timedelta(seconds=delay)),
+                      args=[bot, channel_id], id=PENDING_PUBLISH_JOB, replace_existing=True)
 
-    last_message_time = await req.get_last_message_time()
-    if last_message_time:
-        last_message_time = make_aware(last_message_time, msk_tz)
-    # Проверка низкой активности
-    if 11 <= now.hour < 23:
-        if last_message_time is None or (now - last_message_time) > timedelta(hours=2):
-            delay = random.randint(6, 36)  # Задержка 1–60 минут
-            await asyncio.sleep(delay)
-        last_message_time = await req.get_last_message_time()
-        last_message_time = make_aware(last_message_time, msk_tz)
-        if last_message_time is None or (now - last_message_time) > timedelta(hours=2):
-            pending_posts = await get_pending_posts()
-            if pending_posts:
-                post = random.choice(pending_posts)
+
+async def publish_pending_post(bot: Bot, channel_id: int):
+    """Разовый job: публикует один случайный пост из очереди, если чат всё ещё молчит."""
+    if _pending_lock.locked():
+        return
+    async with _pending_lock:
+        msk_tz = get_settings().tz
+        async with unit_of_work():
+            # За время задержки в чат могли что-то опубликовать — проверяем заново
+            if not _chat_is_quiet(await req.get_last_message_time(), datetime.now(msk_tz)):
+                return
+            post = await req.get_random_pending_post()
+            if post:
                 await post_content(bot, getattr(post, 'chat_id', None) or channel_id, post)
                 await delete_pending_post(post.id)
 
 
+@dataclass(frozen=True, slots=True)
+class BroadcastSnapshot:
+    """Что нужно post_content для публикации broadcast-поста — без привязки к сессии."""
+    id: str
+    chat_id: int
+    content_type: str
+    text: str | None
+    photo_file_ids: tuple[str, ...]
+    entities: list
+    broadcast_id: int
+    planned_at: datetime  # слот, в который публикация должна была выйти
+
+    @classmethod
+    def of(cls, bp) -> 'BroadcastSnapshot':
+        return cls(f"broadcast:{bp.id}", bp.chat_id, bp.content_type, bp.text,
+                   tuple(bp.photo_file_ids or ()), getattr(bp, 'entities', None) or [],
+                   bp.id, make_aware(bp.next_run_time, get_settings().tz))
+
+
+async def _deliver_broadcast(bot: Bot, snap: BroadcastSnapshot):
+    messages = await post_content(bot, snap.chat_id, snap)
+    actual_at = datetime.now(get_settings().tz)
+    delivery_log.add(dict(
+        broadcast_id=snap.broadcast_id,
+        chat_id=snap.chat_id,
+        message_ids=[m.message_id for m in messages or []],
+        planned_at=snap.planned_at.replace(tzinfo=None),
+        actual_at=actual_at.replace(tzinfo=None),
+        latency_ms=int((actual_at - snap.planned_at).total_seconds() * 1000),
+        delivered=bool(messages),
+    ))
+
+
+def _submit_broadcasts(bot: Bot, snaps: list[BroadcastSnapshot]):
+    for snap in snaps:
+        publisher.submit(snap.chat_id, partial(_deliver_broadcast, bot, snap))
+
+
 async def broadcast_task(bot: Bot, scheduler):
-    """Рассылка broadcast-постов без «догоняющей» публикации:
-    - За один проход публикуется максимум одно сообщение на кампанию.
-    - Если режим limited и сейчас вне окна — переносим next_run_time на ближайшее начало окна (без публикации).
-    - После публикации переносим next_run_time в будущее (с учётом окна).
+    """Рассылка broadcast-постов по календарю слотов (broadcast_planner), без «догоняющей» публикации:
+    - Таймер стоит на ближайший слот; выбираются кампании, которым пора публиковаться (next_run_time <= now, по индексу).
+    - За одно срабатывание публикуется максимум одно сообщение на кампанию.
+    - Следующий next_run_time — следующий слот календаря, а не now + interval, поэтому задержки не накапливаются.
+    - Если режим limited и сейчас вне окна (окно сменили) — без публикации, next_run_time на ближайший слот.
+    - Новые next_run_time/last_run_time всех кампаний пишутся одним пакетным UPDATE, публикации
+      после commit уходят в очереди чатов publisher и идут параллельно, тик их не ждёт.
     """
-    from app.database.requests import get_active_broadcast_posts, update_broadcast_run, get_broadcast_config
+    from app.database.requests import get_due_broadcast_posts, update_broadcast_runs
+    msk_tz = get_settings().tz
+    now = datetime.now(msk_tz)
     try:
-        msk_tz = pytz.timezone("Europe/Moscow")
-        now = datetime.now(msk_tz)
-        cfg = await get_broadcast_config()
-        broadcasts = await get_active_broadcast_posts()
-
-        for bp in broadcasts:
-            # Helpers
-            def aware(dt):
-                if dt is None:
-                    return None
-                return msk_tz.localize(dt) if dt.tzinfo is None else dt.astimezone(msk_tz)
-
-            def in_window(dt: datetime, mode: str, start_min: int, end_min: int) -> bool:
-                if mode != 'limited':
-                    return True
-                mins = dt.hour * 60 + dt.minute
-                if start_min <= end_min:
-                    return start_min <= mins < end_min
-                # окно через полночь
-                return mins >= start_min or mins < end_min
-
-            def next_window_start_from(ref: datetime, mode: str, start_min: int, end_min: int) -> datetime:
-                if mode != 'limited':
-                    return ref
-                day_start = ref.replace(hour=0, minute=0, second=0, microsecond=0)
-                start_today = day_start + timedelta(minutes=start_min)
-                end_today = day_start + timedelta(minutes=end_min)
-                if ref < start_today:
-                    return start_today
-                if ref >= end_today:
-                    return start_today + timedelta(days=1)
-                return ref  # внутри окна
-
-            next_run = aware(bp.next_run_time)
-            end_time = aware(bp.end_time)
-            if not next_run or not end_time:
-                continue
-
-            # Деактивируем, если кампания завершилась
-            if now > end_time:
-                await update_broadcast_run(
-                    bp.id,
-                    next_run_time=None,
-                    last_run_time=(aware(bp.last_run_time) or now).replace(tzinfo=None),
-                    deactivate=True
-                )
-                continue
-
-            # Параметры режима/окна
-            mode = getattr(bp, 'mode', 'full') or 'full'
-            start_min = getattr(bp, 'active_start_min', 9 * 60)
-            end_min = getattr(bp, 'active_end_min', 23 * 60)
-            if mode == 'limited' and cfg and not cfg.enabled:
-                mode = 'full'
-
-            interval = timedelta(minutes=bp.interval_minutes)
-
-            # Если пора публиковать (или мы «опоздали»), решаем, публиковать ли сейчас
-            if next_run <= now:
-                # В limited вне окна — перенос на ближайшее окно, публикации нет
-                if not in_window(now, mode, start_min, end_min):
-                    new_next = next_window_start_from(now, mode, start_min, end_min)
-                    if new_next > end_time:
-                        await update_broadcast_run(
-                            bp.id, None, last_run_time=(aware(bp.last_run_time) or now).replace(tzinfo=None), deactivate=True
-                        )
-                    else:
-                        await update_broadcast_run(
-                            bp.id, new_next.replace(tzinfo=None), last_run_time=(aware(bp.last_run_time) or now).replace(tzinfo=None)
-                        )
+        async with unit_of_work():
+            naive_now = now.replace(tzinfo=None)
+            broadcasts = await get_due_broadcast_posts(now)
+
+            runs, snaps = [], []
+            for bp in broadcasts:
+                end_time = make_aware(bp.end_time, msk_tz)
+                if not bp.next_run_time or not end_time:
                     continue
+                last_run = bp.last_run_time or naive_now
 
-                # Публикуем ОДИН раз
-                class _Tmp:
-                    pass
-                tmp = _Tmp()
-                tmp.content_type = bp.content_type
-                tmp.text = bp.text
-                tmp.photo_file_ids = bp.photo_file_ids or []
-                tmp.chat_id = bp.chat_id
-                tmp.id = f"broadcast:{bp.id}"
-                tmp.entities = getattr(bp, 'entities', [])  # НОВОЕ: передаём entities
-
-                try:
-                    await post_content(bot, bp.chat_id, tmp)
-                except Exception as e:
-                    logger.error(f"Ошибка публикации broadcast {bp.id}: {e}")
-                    # Перенесём попытку на следующий интервал, чтобы не спамить
-                    new_next = next_window_start_from(now + interval, mode, start_min, end_min)
-                    if new_next > end_time:
-                        await update_broadcast_run(bp.id, None, last_run_time=now.replace(tzinfo=None), deactivate=True)
-                    else:
-                        await update_broadcast_run(bp.id, new_next.replace(tzinfo=None), last_run_time=now.replace(tzinfo=None))
-                    continue
-
-                # Обновляем next_run_time в будущее
-                new_next = now + interval
-                if not in_window(new_next, mode, start_min, end_min):
-                    new_next = next_window_start_from(new_next, mode, start_min, end_min)
+                # После end_time — деактивация без публикации; None и после последнего слота кампании
+                new_next = broadcast_planner.next_slot(bp, now) if now <= end_time else None
+                if now <= end_time and in_window(now, *broadcast_planner.window(bp)):
+                    snaps.append(BroadcastSnapshot.of(bp))
+                    last_run = naive_now
 
-                if new_next > end_time:
-                    await update_broadcast_run(bp.id, None, last_run_time=now.replace(tzinfo=None), deactivate=True)
+                if new_next is None:
+                    runs.append(dict(id=bp.id, next_run_time=bp.next_run_time, last_run_time=last_run, is_active=False))
                 else:
-                    await update_broadcast_run(bp.id, new_next.replace(tzinfo=None), last_run_time=now.replace(tzinfo=None))
+                    runs.append(dict(id=bp.id, next_run_time=new_next.replace(tzinfo=None), last_run_time=last_run,
+                                     is_active=True))
 
-            else:
-                # Ещё не время. Если limited и next вне окна — аккуратно подтянем к ближайшему окну в будущем.
-                if not in_window(next_run, mode, start_min, end_min):
-                    aligned = next_window_start_from(next_run, mode, start_min, end_min)
-                    if aligned != next_run:
-                        if aligned > end_time:
-                            await update_broadcast_run(
-                                bp.id, None, last_run_time=(aware(bp.last_run_time) or now).replace(tzinfo=None), deactivate=True
-                            )
-                        else:
-                            await update_broadcast_run(
-                                bp.id, aligned.replace(tzinfo=None), last_run_time=(aware(bp.last_run_time) or now).replace(tzinfo=None)
-                            )
-                # иначе просто ждём
+            await update_broadcast_runs(runs)
+            after_commit(partial(_submit_broadcasts, bot, snaps))
     except Exception as e:
         logger.exception(f"broadcast_task fatal error: {e}")
+    finally:
+        broadcast_planner.skip_past(now)
+        broadcast_planner.arm()
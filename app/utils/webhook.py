@@ -0,0 +1,72 @@
+# utils/webhook.py
+import asyncio
+import logging
+import os
+import secrets
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Режим webhook (BOT_MODE=webhook): aiohttp-сервер вместо long polling.
+
+    Telegram шлёт апдейты на WEBHOOK_URL + WEBHOOK_PATH; запросы без верного
+    X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET) отклоняются с 401. Без WEBHOOK_SECRET
+    секрет генерируется на время запуска и передаётся в set_webhook — принимать апдейты
+    без проверки сервер не будет. При SIGINT/SIGTERM сервер перестаёт принимать соединения,
+    dispatcher дожидается начатых хендлеров и останавливает планировщик (shutdown-хуки dp),
+    и только после этого закрывается сессия бота.
+    """
+    path = os.getenv('WEBHOOK_PATH', '/webhook')
+    secret = os.getenv('WEBHOOK_SECRET')
+    if not secret:
+        secret = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET is not set, using a random secret for this run")
+    public_url = os.getenv('WEBHOOK_URL')
+    host = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    port = int(os.getenv('WEBHOOK_PORT', '8080'))
+
+    async def set_webhook():
+        if public_url:
+            await bot.set_webhook(public_url.rstrip('/') + path, secret_token=secret,
+                                  allowed_updates=dp.resolve_used_update_types())
+            logger.info(f"Webhook set to {public_url.rstrip('/') + path}")
+        else:
+            # Локальный запуск (scripts/fake_update.py): апдейты шлём сами, Telegram не трогаем
+            logger.warning("WEBHOOK_URL is not set, webhook is not registered in Telegram")
+
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+    # Апдейт обрабатывается в фоне, Telegram получает ответ сразу; при остановке начатые
+    # хендлеры дожидается drain_updates. register() не используем: он закрывает сессию бота
+    # в on_shutdown раньше shutdown-хуков dp, и drain с планировщиком остались бы без сети
+    handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=True)
+    app.router.add_route('POST', path, handler.handle)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Webhook server listening on {host}:{port}{path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        try:
+            await runner.cleanup()
+        finally:
+            await bot.session.close()
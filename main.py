@@ -1,26 +1,63 @@
 import os
 import asyncio
+import time
+from datetime import timedelta
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.types import Message
 from aiogram.filters import Command
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 
 from app.handlers.menu import menu_router
 from app.handlers.admin_handlers import router1
 from app.handlers.handlers import router, pin_post, delete_scheduled_post
 from app.database.models import async_main
+from app.database.admin_crud import load_admins
+from app.database.fsm_storage import SQLiteStorage
+from app.database.orders import expire_orders
+from app.database.deliveries import record_deliveries
 from dotenv import load_dotenv
 from app.middlewares.album import AlbumMiddleware
-from app.utils.scheduler import scheduler_task, pending_task, handle_missed_tasks, broadcast_task
+from app.middlewares.flood_control import flood_control
+from app.middlewares.unit_of_work import UnitOfWorkMiddleware, CommitBeforeRequestMiddleware
+from app.middlewares.in_flight import in_flight
+from app.database.requests import get_unpublished_scheduled_posts, get_active_broadcast_posts, get_broadcast_config
+from app.utils.publish_queue import publish_queue
+from app.utils.broadcast_planner import broadcast_planner
+from app.utils.delivery_log import delivery_log
+from app.utils.publisher import publisher
+from app.utils.webhook import run_webhook
+from app.settings import get_settings
+from app.utils.scheduler import (publish_scheduled_post, pending_task, handle_missed_tasks, broadcast_task,
+                                 set_bot, POST_JOBSTORE)
 
 load_dotenv()
 
-
+# Настройки читаются и проверяются один раз: с неверным id чата бот не стартует
+settings = get_settings()
 bot = Bot(token=os.getenv("BOT_TOKEN"))
-dp = Dispatcher()
-dp.message.middleware(AlbumMiddleware())
-scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
+bot.session.middleware(CommitBeforeRequestMiddleware())
+bot.session.middleware(flood_control)
+dp = Dispatcher(storage=SQLiteStorage())
+dp["settings"] = settings  # доступны в хендлерах аргументом settings
+dp.update.outer_middleware(in_flight)
+dp.message.middleware(AlbumMiddleware(backend=os.getenv('ALBUM_BACKEND', 'memory')))
+# Регистрируется после AlbumMiddleware — сессия не держится, пока собирается альбом
+dp.message.middleware(UnitOfWorkMiddleware())
+dp.callback_query.middleware(UnitOfWorkMiddleware())
+set_bot(bot)
+# Интервальные job'ы регистрируются заново при каждом старте и живут в памяти;
+# job'ы постов (открепление/удаление/уведомления) хранятся в БД и переживают рестарт
+scheduler = AsyncIOScheduler(
+    timezone=settings.tz,
+    jobstores={
+        'default': MemoryJobStore(),
+        POST_JOBSTORE: SQLAlchemyJobStore(url=os.getenv('JOBSTORE_URL', 'sqlite:///jobs.sqlite3')),
+    },
+)
 
 
 # @dp.message(CommandStart())
@@ -32,38 +69,80 @@ scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
 
 @dp.message(Command('pin_post'))  # /pin_post [id] date[HH:MM DD-MM-YYYY]
 async def command_pin_post(message: Message):
-    await pin_post(message, bot, os.getenv('CHANNEL_ID'), scheduler)
+    await pin_post(message, bot, settings.channel_id, scheduler)
 
 
 @dp.message(Command('delete_scheduled_post'))
 async def command_delete_post(message: Message):
-    await delete_scheduled_post(message, bot, os.getenv('CHANNEL_ID'))
+    await delete_scheduled_post(message, bot, settings.channel_id)
 
 
 async def on_startup(dispatcher):
-    scheduler.add_job(scheduler_task, "interval", minutes=1, args=[bot, os.getenv('MAIN_CHAT_ID'), scheduler],
-                      id='scheduler_task', replace_existing=True)
-    scheduler.add_job(pending_task, "interval", minutes=1, args=[bot, os.getenv('MAIN_CHAT_ID')],
+    # Публикации по расписанию — через очередь по времени, а не ежеминутным проходом по таблице
+    publish_queue.seed(await get_unpublished_scheduled_posts())
+    publish_queue.start(partial(publish_scheduled_post, bot, settings.main_chat_id, scheduler))
+    scheduler.add_job(pending_task, "interval", minutes=1, args=[bot, settings.main_chat_id, scheduler],
                       id='pending_task', replace_existing=True)
-    scheduler.add_job(broadcast_task, "interval", minutes=1, args=[bot, scheduler],
-                      id='broadcast_task', replace_existing=True)
+    # Рассылки — по календарю слотов: таймер на ближайший слот вместо ежеминутного опроса
+    broadcast_planner.seed(await get_active_broadcast_posts(), await get_broadcast_config())
+    broadcast_planner.start(scheduler, partial(broadcast_task, bot, scheduler))
+    delivery_log.start(record_deliveries)
+    # Заказы, которые админы так и не обработали, переводим в expired
+    scheduler.add_job(expire_orders, "interval", hours=1, args=[timedelta(days=int(os.getenv('ORDER_TTL_DAYS', '7')))],
+                      id='expire_orders', replace_existing=True)
     scheduler.start()
     print("Планировщик запущен")
+    # Сверка сохранённых job'ов с БД — только после start(), иначе хранилище ещё не открыто.
+    # Идёт в фоне: апдейты пользователей обрабатываются сразу, не дожидаясь восстановления
+    global _recovery_task
+    _recovery_task = asyncio.create_task(handle_missed_tasks(bot, settings.main_chat_id, scheduler),
+                                         name='missed_tasks_recovery')
+
+
+_recovery_task: asyncio.Task | None = None
+_startup_timings: dict[str, float] = {}
+
+
+async def _log_startup_time(started: float):
+    _startup_timings['startup hooks'] = time.perf_counter() - started - sum(_startup_timings.values())
+    report = ', '.join(f'{phase} {spent:.2f}s' for phase, spent in _startup_timings.items())
+    print(f"Старт занял {time.perf_counter() - started:.2f}s ({report}), восстановление продолжается в фоне")
+
+
+async def drain_updates(dispatcher):
+    """Перед остановкой дожидаемся уже начатых хендлеров (новые апдейты к этому моменту не принимаются)."""
+    await in_flight.drain(float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '30')))
 
 
 async def on_shutdown(dispatcher):
     """Остановка планировщика."""
+    if _recovery_task and not _recovery_task.done():
+        _recovery_task.cancel()
+    await publish_queue.stop()
+    await publisher.stop()
+    await delivery_log.stop()  # дописываем журнал рассылок
+    await dp.storage.close()  # дописываем несохранённые FSM-состояния
     scheduler.shutdown()
     print("Планировщик остановлен")
 
 
 async def main():
     dp.startup.register(on_startup)
+    dp.shutdown.register(drain_updates)
     dp.shutdown.register(on_shutdown)
     dp.include_routers(router, router1, menu_router)
+    started = phase = time.perf_counter()
     await async_main()
-    await handle_missed_tasks(bot, os.getenv('MAIN_CHAT_ID'), scheduler)
-    await dp.start_polling(bot)
+    _startup_timings['schema'] = time.perf_counter() - phase
+    phase = time.perf_counter()
+    await load_admins()
+    _startup_timings['admins'] = time.perf_counter() - phase
+    dp.startup.register(partial(_log_startup_time, started))
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        await bot.delete_webhook()  # после работы в режиме webhook getUpdates иначе вернёт конфликт
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+"""Пропускная способность приёма альбомов в pending_posts при параллельных частях.
+
+Запуск из корня репозитория:
+    python scripts/bench_album_ingest.py [--albums 200] [--parts 10] [--concurrency 50]
+
+Сравниваются две стратегии на одной временной БД (таблица очищается между прогонами):
+  read-modify-write — прежняя: SELECT строки альбома, extend списка в Python, commit;
+  upsert            — add_or_update_pending_post: INSERT ... ON CONFLICT для строки альбома
+                      и дописывание фото в post_media без чтения.
+Каждая часть альбома пишется отдельным вызовом, части разных альбомов перемешаны.
+Помимо скорости считается, сколько file_id потерялось и сколько лишних строк появилось.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Движок приложения создаётся при импорте из DB_URL — направляем его во временную БД до импорта
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DB_URL'] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'bench.sqlite3')}"
+
+from sqlalchemy import select, delete  # noqa: E402
+from sqlalchemy.exc import IntegrityError, OperationalError  # noqa: E402
+
+import app.database.requests as req  # noqa: E402
+from app.database.models import Base, PendingPost, PostMedia, async_session, engine  # noqa: E402
+
+
+async def legacy_add(text: str, file_id: str, media_group_id: int):
+    async with async_session() as session:
+        async with session.begin():
+            existing = await session.scalar(select(PendingPost).where(PendingPost.media_group_id == media_group_id))
+            if existing:
+                existing.photo_file_ids = existing.photo_file_ids + [file_id]
+                existing.text = text or existing.text
+            else:
+                session.add(PendingPost(content_type='photo', text=text, photo_file_ids=[file_id],
+                                        media_group_id=media_group_id, chat_id=1, entities=[]))
+
+
+async def run(strategy: str, albums: int, parts: int, concurrency: int) -> dict:
+    async with async_session() as session:
+        await session.execute(delete(PendingPost))
+        await session.execute(delete(PostMedia))
+        await session.commit()
+
+    jobs = [(a, p) for a in range(1, albums + 1) for p in range(parts)]
+    random.shuffle(jobs)
+    sem = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(album: int, part: int):
+        nonlocal errors
+        text = f'album {album}' if part == 0 else ''
+        file_id = f'{album}:{part}'
+        async with sem:
+            try:
+                if strategy == 'upsert':
+                    await req.add_or_update_pending_post('photo', text, [file_id], album, chat_id=1)
+                else:
+                    await legacy_add(text, file_id, album)
+            except (IntegrityError, OperationalError):  # у прежней стратегии гонка на вставке первой части
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(a, p) for a, p in jobs))
+    elapsed = time.perf_counter() - started
+
+    rows = await req.get_pending_posts()  # фото из post_media, у прежней стратегии — из JSON
+    stored = sum(len(r.photo_file_ids or []) for r in rows)
+    return {
+        'parts/s': len(jobs) / elapsed,
+        'rows': len(rows),
+        'extra rows': len(rows) - albums,
+        'lost file_ids': len(jobs) - stored,
+        'errors': errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--albums', type=int, default=200)
+    parser.add_argument('--parts', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    print(f"{args.albums} albums x {args.parts} parts, concurrency {args.concurrency}")
+    for strategy in ('read-modify-write', 'upsert'):
+        res = await run(strategy, args.albums, args.parts, args.concurrency)
+        print(f"{strategy:>18}: " + ', '.join(
+            f"{k} {v:.0f}" if isinstance(v, float) else f"{k} {v}" for k, v in res.items()))
+    await engine.dispose()
+    _tmp.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""Сравнение профилей движка SQLite (DB_PROFILE): пропускная способность записи и чтения.
+
+Запуск из корня репозитория:
+    python scripts/bench_db_profile.py [--writers 8] [--writes 200] [--readers 4] [--reads 500]
+
+Каждый профиль гоняется на отдельной временной БД. Писатели коммитят по одной строке,
+как это делают хендлеры и планировщик, читатели параллельно выбирают «созревшие» посты.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from app.database.models import Base, ENGINE_PROFILES, ScheduledPost, make_engine  # noqa: E402
+
+
+async def run_profile(profile: str, path: str, writers: int, writes: int, readers: int, reads: int) -> dict:
+    engine = make_engine(f'sqlite+aiosqlite:///{path}', profile)
+    session_factory = async_sessionmaker(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    now = datetime.now()
+    errors = 0
+
+    async def writer(n: int):
+        nonlocal errors
+        for i in range(writes):
+            try:
+                async with session_factory() as session:
+                    session.add(ScheduledPost(
+                        content_type='text', text=f'bench {n}-{i}', photo_file_ids=[],
+                        scheduled_time=now + timedelta(seconds=i), media_group_id=0, chat_id=-100,
+                    ))
+                    await session.commit()
+            except OperationalError:
+                errors += 1
+
+    async def reader():
+        nonlocal errors
+        for _ in range(reads):
+            try:
+                async with session_factory() as session:
+                    await session.scalars(
+                        select(ScheduledPost.id)
+                        .where(ScheduledPost.is_published == False, ScheduledPost.scheduled_time <= now)
+                        .limit(50)
+                    )
+            except OperationalError:
+                errors += 1
+
+    t0 = time.perf_counter()
+    write_tasks = [asyncio.create_task(writer(n)) for n in range(writers)]
+    read_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+    await asyncio.gather(*write_tasks)
+    t_write = time.perf_counter() - t0
+    await asyncio.gather(*read_tasks)
+    t_total = time.perf_counter() - t0
+    await engine.dispose()
+    return {
+        'writes_per_s': writers * writes / t_write,
+        'reads_per_s': readers * reads / t_total,
+        'errors': errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'writes/s':>12}{'reads/s':>12}{'locked':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ENGINE_PROFILES:
+            res = await run_profile(profile, os.path.join(tmp, f'{profile}.sqlite3'),
+                                    args.writers, args.writes, args.readers, args.reads)
+            print(f"{profile:<10}{res['writes_per_s']:>12.0f}{res['reads_per_s']:>12.0f}{res['errors']:>8}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Отправка поддельных апдейтов в локально запущенный бот в режиме webhook.
+
+Запуск из корня репозитория (бот: BOT_MODE=webhook, WEBHOOK_URL не задан, WEBHOOK_SECRET задан —
+иначе бот сгенерирует свой секрет и отклонит запросы):
+    python scripts/fake_update.py --text /help [--user-id 1] [--count 100] [--concurrency 10]
+
+Адрес и секрет по умолчанию берутся из тех же переменных, что и у бота
+(WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET). Ответы бота в Telegram для выдуманного
+чата, конечно, не дойдут — скрипт проверяет приём и обработку апдейтов и меряет задержку.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def make_update(text: str, user_id: int, username: str, chat_id: int) -> dict:
+    update_id = next(_update_ids)
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id % 1_000_000,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'username': username, 'first_name': username},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': username, 'username': username},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            if text.startswith('/') else [],
+        },
+    }
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}"
+                                         f"{os.getenv('WEBHOOK_PATH', '/webhook')}")
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'))
+    parser.add_argument('--text', default='/help')
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--username', default='fake_user')
+    parser.add_argument('--chat-id', type=int, help='по умолчанию равен --user-id (личный чат)')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1)
+    args = parser.parse_args()
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    sem = asyncio.Semaphore(args.concurrency)
+    statuses: dict[int, int] = {}
+    latencies = []
+
+    async with aiohttp.ClientSession(headers=headers) as http:
+        async def post_one():
+            update = make_update(args.text, args.user_id, args.username, args.chat_id or args.user_id)
+            async with sem:
+                started = time.perf_counter()
+                async with http.post(args.url, json=update) as resp:
+                    await resp.read()
+                    latencies.append(time.perf_counter() - started)
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post_one() for _ in range(args.count)))
+        total = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.count} updates -> {args.url} in {total:.2f}s ({args.count / total:.1f}/s)")
+    print(f"statuses: {statuses}")
+    print(f"latency: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Движок приложения создаётся при импорте из DB_URL — направляем его во временную БД до импорта app.*
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DB_URL'] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'test.sqlite3')}"
+os.environ.setdefault('MAIN_CHAT_ID', '-1001')
+os.environ.setdefault('ADMIN_CHAT_ID', '-1002')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def schema():
+    from app.database.models import async_main, engine
+
+    asyncio.run(async_main())
+    yield
+    asyncio.run(engine.dispose())
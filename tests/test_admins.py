@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from app.database.admin_crud import set_admin, is_admin, delete_admin
+from app.database.models import Admin, async_session
+
+
+async def _stored_user_id(username: str):
+    async with async_session() as session:
+        return await session.scalar(select(Admin.user_id).where(Admin.username == username))
+
+
+def test_taken_over_username_is_not_rebound():
+    async def scenario():
+        await set_admin('BindMe', 1)
+        first = await is_admin('bindme', 501)
+        stranger = await is_admin('BindMe', 502)
+        return first, stranger, await _stored_user_id('BindMe')
+
+    first, stranger, stored = asyncio.run(scenario())
+    assert first == (True, 'BindMe', 1)
+    assert stranger == (False, None, 0)
+    assert stored == 501
+
+
+def test_delete_admin_resolves_both_admins_like_is_admin():
+    async def scenario():
+        await set_admin('ChiefAdmin', 2)
+        await set_admin('Junior', 1)
+        await is_admin('ChiefAdmin', 601)  # привязываем id
+        # username сменил регистр / сменился совсем — админ узнаётся по id
+        chief = SimpleNamespace(username='renamed_chief', id=601)
+        missing = await delete_admin(chief, 'nobody')
+        deleted = await delete_admin(chief, '@junior')
+        return missing, deleted, await is_admin('Junior')
+
+    missing, deleted, junior = asyncio.run(scenario())
+    assert missing is False
+    assert deleted is True
+    assert junior == (False, None, 0)
+
+
+def test_delete_admin_by_unknown_user_is_refused():
+    async def scenario():
+        await set_admin('Victim', 0)
+        return await delete_admin(SimpleNamespace(username='intruder', id=999), 'Victim')
+
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from app.handlers import menu
+from app.utils.broadcast_planner import plan_slots, next_window_start, in_window
+
+DAY = datetime(2026, 3, 2)
+LIMITED = ('limited', menu.WINDOW_START_MIN, menu.WINDOW_END_MIN)
+FULL = ('full', 0, 0)
+
+
+def _slots_per_day(window, interval_minutes: int, days: int = 1) -> list[int]:
+    start = DAY + timedelta(minutes=window[1]) if window[0] == 'limited' else DAY
+    slots = plan_slots(start, timedelta(minutes=interval_minutes), window,
+                       DAY + timedelta(days=days), count=10_000)
+    return [sum(1 for s in slots if s.date() == (DAY + timedelta(days=d)).date()) for d in range(days)]
+
+
+@pytest.mark.parametrize('window, interval, expected', [
+    (LIMITED, 60, 14),
+    (LIMITED, 15, 56),
+    (LIMITED, 180, 5),
+    (FULL, 90, 16),
+    (FULL, 60, 24),
+])
+def test_slots_per_day(window, interval, expected):
+    assert _slots_per_day(window, interval) == [expected]
+
+
+@pytest.mark.parametrize('interval', sorted(menu.BROADCAST_INTERVALS.values()))
+@pytest.mark.parametrize('window, mode', [(LIMITED, 'limited'), (FULL, 'full')])
+def test_plan_agrees_with_paid_count(window, mode, interval):
+    # Сколько сообщений оплачено (menu.count_per_day) — столько слотов и должно выйти каждый день
+    assert _slots_per_day(window, interval, days=3) == [menu.count_per_day(interval, mode)] * 3
+
+
+def test_limited_day_restarts_at_window_start():
+    slots = plan_slots(DAY + timedelta(hours=22, minutes=30), timedelta(minutes=60), LIMITED,
+                       DAY + timedelta(days=2), count=3)
+    assert slots == [DAY + timedelta(hours=22, minutes=30), DAY + timedelta(days=1, hours=9),
+                     DAY + timedelta(days=1, hours=10)]
+
+
+def test_window_across_midnight():
+    window = ('limited', 22 * 60, 2 * 60)
+    slots = plan_slots(DAY + timedelta(hours=12), timedelta(minutes=60), window,
+                       DAY + timedelta(days=2), count=6)
+    assert [s.time() for s in slots] == [time(22), time(23), time(0), time(1), time(22), time(23)]
+    assert slots[2] == DAY + timedelta(days=1)
+    assert in_window(DAY + timedelta(hours=1, minutes=59), *window)
+    assert not in_window(DAY + timedelta(hours=2), *window)
+    # Между концом и началом окна того же дня — ждём начала сегодня, а не завтра
+    assert next_window_start(DAY + timedelta(hours=5), *window) == DAY + timedelta(hours=22)
+
+
+def test_slots_stop_at_end_time_and_skip_after():
+    start = DAY + timedelta(hours=10)
+    slots = plan_slots(start, timedelta(minutes=30), FULL, start + timedelta(hours=1), count=10,
+                       after=start)
+    assert slots == [start + timedelta(minutes=30), start + timedelta(hours=1)]
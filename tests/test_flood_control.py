@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from app.middlewares import flood_control as fc
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fc.time, 'monotonic', clock)
+    return clock
+
+
+def test_reserve_spends_burst_then_queues(clock):
+    bucket = fc.TokenBucket(rate=2.0, capacity=3.0)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Каждый следующий ждёт ещё 1/rate: резерв сохраняет порядок без блокировок
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_reserve_refills_up_to_capacity(clock):
+    bucket = fc.TokenBucket(rate=1.0, capacity=2.0)
+    bucket.reserve(2)
+    clock.now += 100
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_block_delays_whole_queue(clock):
+    bucket = fc.TokenBucket(rate=1.0, capacity=3.0)
+    bucket.block(10)
+    assert bucket.reserve() == pytest.approx(11.0)
+    assert bucket.reserve() == pytest.approx(12.0)
+
+
+def test_idle_full_chat_buckets_are_swept(clock):
+    mw = fc.FloodControlMiddleware(sweep_interval=60)
+    mw._chat_bucket(1).reserve()
+    mw._chat_bucket(-100).block(600)  # после 429 — ещё не наполнилась
+    clock.now += 61
+    mw._chat_bucket(2)  # новая корзина запускает чистку
+    assert set(mw.chat_buckets) == {-100, 2}
+
+
+def test_buckets_with_waiters_are_kept(clock):
+    mw = fc.FloodControlMiddleware(sweep_interval=60)
+    mw._chat_bucket(1)
+    mw.waiting_by_chat[1] = 1
+    clock.now += 61
+    mw._chat_bucket(2)
+    assert set(mw.chat_buckets) == {1, 2}
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    """Вместо ожидания — запись задержки и сдвиг часов; управление всё равно отдаётся циклу."""
+    calls = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        calls.append(delay)
+        await real_sleep(0)
+        clock.now += delay
+
+    monkeypatch.setattr(fc.asyncio, 'sleep', fake_sleep)
+    return calls
+
+
+def test_blocked_chat_does_not_hold_global_capacity(clock, sleeps):
+    mw = fc.FloodControlMiddleware(global_rate=1.0)
+    mw._chat_bucket(-1).block(10)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append((method.chat_id, dict(mw.waiting_by_chat)))
+        return True
+
+    async def scenario():
+        blocked = asyncio.create_task(mw(make_request, None, SendMessage(chat_id=-1, text='a')))
+        await asyncio.sleep(0)  # запрос в заблокированный чат встал в очередь чата
+        await mw(make_request, None, SendMessage(chat_id=-2, text='b'))
+        await blocked
+
+    asyncio.run(scenario())
+    # Второй чат ушёл сразу, не дожидаясь глобального токена, — первый его ещё не взял
+    assert sent == [(-2, {-1: 1}), (-1, {})]
+    # Пока первый ждал свой чат, глобальная корзина наполнилась — второго ожидания нет
+    assert [d for d in sleeps if d] == [pytest.approx(10 + 1 / fc.GROUP_RATE)]
+
+
+def _flaky(failures: int, retry_after: int = 7):
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method)
+        if len(calls) <= failures:
+            raise TelegramRetryAfter(method, 'Too Many Requests', retry_after)
+        return 'ok'
+
+    return make_request, calls
+
+
+def test_retry_after_is_retried_until_success(clock, sleeps):
+    mw = fc.FloodControlMiddleware()
+    make_request, calls = _flaky(failures=2)
+    result = asyncio.run(mw(make_request, None, SendMessage(chat_id=5, text='hi')))
+    assert result == 'ok'
+    assert len(calls) == 3
+    assert mw.retry_after_hits == 2
+    assert mw.sent == 1
+    # Каждый повтор ждёт retry_after и свой токен личного чата (1 / PRIVATE_RATE)
+    assert sleeps == [pytest.approx(8.0), pytest.approx(8.0)]
+
+
+def test_retry_after_gives_up_after_max_retries_and_keeps_chat_blocked(clock, sleeps):
+    mw = fc.FloodControlMiddleware(max_retries=5)
+    make_request, calls = _flaky(failures=100)
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(mw(make_request, None, SendMessage(chat_id=5, text='hi')))
+    assert len(calls) == 6  # первая попытка и 5 повторов
+    assert mw.retry_after_hits == 6
+    assert mw.sent == 0
+    # Следующий запрос в этот чат всё равно подождёт retry_after
+    assert mw._chat_bucket(5).reserve() >= 7.0
+
+
+def test_retry_after_without_chat_sleeps_globally(clock, sleeps):
+    mw = fc.FloodControlMiddleware()
+    make_request, calls = _flaky(failures=1, retry_after=3)
+    assert asyncio.run(mw(make_request, None, GetMe())) == 'ok'
+    assert sleeps == [3]
+    assert mw.chat_buckets == {}
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import event, select
+
+from app.database.fsm_storage import SQLiteStorage, _utcnow
+from app.database.models import FSMRecord, async_session, engine
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def _row(storage: SQLiteStorage, key: StorageKey):
+    async with async_session() as session:
+        return await session.get(FSMRecord, storage._key(key))
+
+
+def _storage(**kwargs) -> SQLiteStorage:
+    # Фоновый flush не мешает: сбрасываем вручную
+    return SQLiteStorage(flush_interval=3600, **kwargs)
+
+
+def test_changes_reach_db_only_on_flush_and_survive_restart():
+    key = _key(101)
+
+    async def scenario():
+        storage = _storage()
+        await storage.set_state(key, 'Form:name')
+        await storage.set_data(key, {'step': 1})
+        before = await _row(storage, key)
+        await storage.close()  # close() дописывает несохранённое
+        fresh = _storage()
+        restored = await fresh.get_state(key), await fresh.get_data(key)
+        await fresh.close()
+        return before, restored
+
+    before, restored = asyncio.run(scenario())
+    assert before is None
+    assert restored == ('Form:name', {'step': 1})
+
+
+def test_cleared_state_deletes_row():
+    key = _key(102)
+
+    async def scenario():
+        storage = _storage()
+        await storage.set_state(key, 'Form:name')
+        await storage.flush()
+        stored = await _row(storage, key)
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        await storage.flush()
+        gone = await _row(storage, key)
+        await storage.close()
+        return stored, gone
+
+    stored, gone = asyncio.run(scenario())
+    assert stored is not None and stored.state == 'Form:name'
+    assert gone is None
+
+
+def test_misses_in_one_tick_are_loaded_with_one_select():
+    keys = [_key(110 + i) for i in range(5)]
+    selects = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.startswith('SELECT') and 'fsm_states' in statement:
+            selects.append(statement)
+
+    async def scenario():
+        storage = _storage()
+        for i, key in enumerate(keys[:2]):
+            await storage.set_data(key, {'i': i})
+        await storage.close()
+        fresh = _storage()
+        event.listen(engine.sync_engine, 'before_cursor_execute', count)
+        try:
+            return await asyncio.gather(*(fresh.get_data(key) for key in keys))
+        finally:
+            event.remove(engine.sync_engine, 'before_cursor_execute', count)
+            await fresh.close()
+
+    assert asyncio.run(scenario()) == [{'i': 0}, {'i': 1}, {}, {}, {}]
+    assert len(selects) == 1
+
+
+def test_purge_removes_abandoned_states():
+    old_key, live_key = _key(120), _key(121)
+
+    async def scenario():
+        storage = _storage(ttl=timedelta(hours=1))
+        await storage.set_state(old_key, 'Form:old')
+        await storage.set_state(live_key, 'Form:live')
+        # Состояние не трогали дольше ttl
+        storage._cache[storage._key(old_key)].updated_at = _utcnow() - timedelta(hours=2)
+        await storage.flush()
+        await storage.purge_expired()
+        async with async_session() as session:
+            keys = set(await session.scalars(select(FSMRecord.key).where(
+                FSMRecord.key.in_([storage._key(old_key), storage._key(live_key)]))))
+        cached = storage._key(old_key) in storage._cache
+        await storage.close()
+        return keys, cached
+
+    keys, cached = asyncio.run(scenario())
+    assert keys == {SQLiteStorage._key(live_key)}
+    assert not cached
+
+
+def test_expired_state_reads_as_empty():
+    key = _key(130)
+
+    async def scenario():
+        storage = _storage(ttl=timedelta(hours=1))
+        await storage.set_state(key, 'Form:stale')
+        storage._cache[storage._key(key)].updated_at = _utcnow() - timedelta(hours=2)
+        state = await storage.get_state(key)
+        await storage.close()
+        return state, await _row(storage, key)
+
+    assert asyncio.run(scenario()) == (None, None)
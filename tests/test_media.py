@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import app.database.requests as req
+
+
+def test_pending_post_with_one_photo():
+    async def scenario():
+        await req.add_or_update_pending_post('photo', 'one photo', ['file-a'], 0, chat_id=1,
+                                             photo_unique_ids=['uniq-a'])
+        posts = await req.get_pending_posts()
+        return [p.photo_file_ids for p in posts if p.text == 'one photo']
+
+    assert asyncio.run(scenario()) == [['file-a']]
+
+
+def test_album_parts_are_appended_in_order():
+    async def scenario():
+        for i in range(3):
+            await req.add_or_update_pending_post('photo', 'album' if i == 0 else '', [f'album-{i}'], 777, chat_id=1)
+        posts = await req.get_pending_posts()
+        return [p.photo_file_ids for p in posts if p.media_group_id == 777]
+
+    assert asyncio.run(scenario()) == [['album-0', 'album-1', 'album-2']]
+
+
+def test_scheduled_post_with_one_photo():
+    async def scenario():
+        post_id = await req.add_or_update_scheduled_post('photo', 'scheduled', ['file-b'],
+                                                         scheduled_time=datetime.now() + timedelta(days=1),
+                                                         chat_id=1, photo_unique_ids=['uniq-b'])
+        stored = await req.get_scheduled_post(post_id)
+        return stored.photo_file_ids
+
+    assert asyncio.run(scenario()) == ['file-b']
+
+
+def test_broadcast_post_with_one_photo():
+    async def scenario():
+        now = datetime.now()
+        post = await req.add_broadcast_post('photo', 'broadcast', ['file-c'], 0, now + timedelta(minutes=5),
+                                            now + timedelta(days=1), 60, chat_id=1, photo_unique_ids=['uniq-c'])
+        stored = await req.get_broadcast(post.id)
+        return post.photo_file_ids, stored.photo_file_ids
+
+    assert asyncio.run(scenario()) == (['file-c'], ['file-c'])
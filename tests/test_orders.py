@@ -0,0 +1,62 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.database import orders as orders_repo
+from app.database.unit_of_work import unit_of_work
+
+
+def _payload(user_id: int = 42) -> dict:
+    return {'order_type': 'publication', 'user_id': user_id, 'text': 'order'}
+
+
+def test_second_transition_fails():
+    order_id = uuid.uuid4().hex
+
+    async def scenario():
+        await orders_repo.create_order(order_id, _payload())
+        first = await orders_repo.transition_order(order_id, orders_repo.CONFIRMED)
+        second = await orders_repo.transition_order(order_id, orders_repo.REJECTED)
+        return first, second, await orders_repo.get_awaiting_order(order_id)
+
+    first, second, awaiting = asyncio.run(scenario())
+    assert first == _payload()
+    assert second is None
+    assert awaiting is None
+
+
+def test_concurrent_transitions_have_one_winner():
+    order_id = uuid.uuid4().hex
+
+    async def decide(to_status):
+        async with unit_of_work():
+            return await orders_repo.transition_order(order_id, to_status)
+
+    async def scenario():
+        await orders_repo.create_order(order_id, _payload())
+        return await asyncio.gather(decide(orders_repo.CONFIRMED), decide(orders_repo.REJECTED))
+
+    results = asyncio.run(scenario())
+    assert sorted(r is not None for r in results) == [False, True]
+
+
+def test_unknown_order_is_not_transitioned():
+    assert asyncio.run(orders_repo.transition_order('missing', orders_repo.CONFIRMED)) is None
+
+
+def test_rolled_back_transition_keeps_order_awaiting():
+    order_id = uuid.uuid4().hex
+
+    async def scenario():
+        await orders_repo.create_order(order_id, _payload())
+        with pytest.raises(RuntimeError):
+            async with unit_of_work():
+                assert await orders_repo.transition_order(order_id, orders_repo.CONFIRMED)
+                raise RuntimeError('rollback')
+        return await orders_repo.get_awaiting_order(order_id), \
+            await orders_repo.transition_order(order_id, orders_repo.REJECTED)
+
+    awaiting, retried = asyncio.run(scenario())
+    assert awaiting == _payload()
+    assert retried == _payload()
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.settings import get_settings
+from app.utils import scheduler
+
+
+def _post(now: datetime, unpin_in: timedelta | None, delete_in: timedelta | None):
+    naive = now.replace(tzinfo=None)
+    return SimpleNamespace(id=7, chat_id=-100, message_ids=[11],
+                           unpin_time=naive + unpin_in if unpin_in else None,
+                           delete_time=naive + delete_in if delete_in else None)
+
+
+def _job_ids(post, now):
+    return [job_id for _, _, _, job_id in scheduler._post_jobs(post, -100, now)]
+
+
+def test_three_day_warnings_are_planned_when_ahead():
+    now = datetime.now(get_settings().tz).replace(microsecond=0)
+    post = _post(now, timedelta(days=5), timedelta(days=6))
+    assert _job_ids(post, now) == ['notify_unpin_3_7', 'unpin_7', 'notify_unpin_7', 'notify_3_delete_7', 'delete_7']
+
+
+def test_past_three_day_warnings_are_skipped():
+    now = datetime.now(get_settings().tz).replace(microsecond=0)
+    post = _post(now, timedelta(days=1), timedelta(days=2))
+    assert _job_ids(post, now) == ['unpin_7', 'notify_unpin_7', 'delete_7']
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.settings import get_settings
+from app.utils.publish_queue import PublishQueue
+
+
+def _run(queue: PublishQueue, expected: int, timeout: float = 2.0) -> list[int]:
+    async def scenario():
+        fired = []
+        done = asyncio.Event()
+
+        async def callback(post_id: int):
+            fired.append(post_id)
+            if len(fired) == expected:
+                done.set()
+
+        queue.start(callback)
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+            await asyncio.sleep(0.05)  # лишние срабатывания тоже попали бы в fired
+        finally:
+            await queue.stop()
+        return fired
+
+    return asyncio.run(scenario())
+
+
+def test_posts_fire_in_scheduled_order():
+    now = datetime.now(get_settings().tz)
+    queue = PublishQueue()
+    queue.schedule_many([(3, now - timedelta(minutes=1)), (1, now - timedelta(minutes=3)),
+                         (2, now - timedelta(minutes=2)), (4, now + timedelta(milliseconds=100))])
+    assert _run(queue, expected=4) == [1, 2, 3, 4]
+
+
+def test_naive_times_are_read_in_settings_tz():
+    queue = PublishQueue()
+    naive_past = datetime.now(get_settings().tz).replace(tzinfo=None) - timedelta(seconds=1)
+    queue.schedule(1, naive_past)
+    queue.schedule(2, datetime.now(get_settings().tz) - timedelta(seconds=2))
+    assert _run(queue, expected=2) == [2, 1]
+
+
+def test_discarded_post_does_not_fire():
+    now = datetime.now(get_settings().tz)
+    queue = PublishQueue()
+    queue.schedule(1, now - timedelta(seconds=2))
+    queue.schedule(2, now - timedelta(seconds=1))
+    queue.discard(1)
+    assert _run(queue, expected=1) == [2]
+    assert len(queue) == 0
+
+
+def test_rescheduled_post_fires_once_at_new_time():
+    now = datetime.now(get_settings().tz)
+    queue = PublishQueue()
+    queue.schedule(1, now + timedelta(days=1))
+    queue.schedule(2, now - timedelta(seconds=1))
+    queue.schedule(1, now - timedelta(seconds=2))  # перенесли раньше — старая запись устарела
+    assert _run(queue, expected=2) == [1, 2]
+
+
+def test_earlier_post_wakes_sleeping_queue():
+    async def scenario():
+        now = datetime.now(get_settings().tz)
+        queue = PublishQueue()
+        fired = asyncio.Queue()
+        queue.schedule(1, now + timedelta(hours=1))
+        queue.start(fired.put)
+        await asyncio.sleep(0.05)  # очередь спит до поста через час
+        queue.schedule(2, now)
+        try:
+            return await asyncio.wait_for(fired.get(), 1.0), len(queue)
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == (2, 1)
+
+
+def test_none_time_removes_post():
+    queue = PublishQueue()
+    queue.schedule(1, datetime.now(get_settings().tz))
+    queue.schedule(1, None)
+    assert len(queue) == 0
@@ -0,0 +1,13 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_handlers_import_without_chat_settings(tmp_path):
+    # Настройки приходят в хендлеры из dp["settings"]; сам импорт окружения не требует
+    env = {'DB_URL': f"sqlite+aiosqlite:///{tmp_path / 'import.sqlite3'}"}
+    code = 'import app.handlers.menu, app.handlers.handlers, app.handlers.admin_handlers'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
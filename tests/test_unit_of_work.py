@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import app.database.requests as req
+from app.database.models import LastMessage, async_session
+from app.database.unit_of_work import unit_of_work, commit, after_commit, session_scope
+from app.utils.publish_queue import publish_queue
+
+
+async def _stored_time():
+    async with async_session() as session:
+        row = await session.get(LastMessage, req.LAST_MESSAGE_ROW_ID)
+        return row.time if row else None
+
+
+def test_commit_makes_changes_visible_before_block_ends():
+    async def scenario():
+        stamp = datetime(2026, 1, 2, 3, 4, 5)
+        calls = []
+        async with unit_of_work():
+            await req.add_last_message_time(stamp)
+            after_commit(lambda: calls.append('done'))
+            await commit()
+            seen_inside = await _stored_time(), list(calls)
+        return stamp, seen_inside
+
+    stamp, (stored, calls) = asyncio.run(scenario())
+    assert stored == stamp
+    assert calls == ['done']
+
+
+def test_commit_from_child_task_is_ignored():
+    async def scenario():
+        stamp = datetime(2026, 2, 3, 4, 5, 6)
+        async with unit_of_work():
+            await req.add_last_message_time(stamp)
+            await asyncio.create_task(commit())
+            return await _stored_time() != stamp
+
+    assert asyncio.run(scenario())
+
+
+def test_child_task_gets_its_own_session():
+    async def child_session():
+        async with session_scope() as session:
+            return session
+
+    async def scenario():
+        async with unit_of_work() as session:
+            return session, await asyncio.create_task(child_session())
+
+    parent, child = asyncio.run(scenario())
+    assert child is not parent
+
+
+def test_rolled_back_delete_keeps_post_in_publish_queue():
+    async def scenario():
+        post_id = await req.add_or_update_scheduled_post('text', 'keep me', None,
+                                                         scheduled_time=datetime.now() + timedelta(days=1), chat_id=1)
+        with pytest.raises(RuntimeError):
+            async with unit_of_work():
+                assert await req.delete_scheduled_post(post_id)
+                raise RuntimeError('rollback')
+        return post_id, await req.get_scheduled_post(post_id)
+
+    post_id, post = asyncio.run(scenario())
+    assert post is not None
+    assert post_id in publish_queue._due